@@ -0,0 +1,194 @@
+"""
+Analytics rollups maintained incrementally in Redis as each task completes:
+totals, per format/voice/emotion counters, hourly and daily series, and a
+log-bucketed latency sketch for p50/p95/p99 of synthesis duration.
+
+Reads cost a fixed handful of Redis calls regardless of history size.
+Regenerate everything from the task index with:
+
+    python analytics_rollups.py rebuild
+"""
+import datetime, logging, math, os, sys
+import redis
+
+redis_client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+
+PREFIX = "analytics"
+DIMENSIONS = {"format": "format", "voice": "voice_id", "emotion": "emotion"}
+HOURLY_RETENTION_HOURS = 14 * 24
+DAILY_RETENTION_DAYS = 400
+PERCENTILES = (0.5, 0.95, 0.99)
+
+# Sketch buckets are geometric with 1% relative error; values under
+# SKETCH_MIN_SECONDS share a single bucket
+SKETCH_RELATIVE_ACCURACY = 0.01
+SKETCH_MIN_SECONDS = 0.001
+_GAMMA = (1 + SKETCH_RELATIVE_ACCURACY) / (1 - SKETCH_RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+_ZERO_BUCKET = "z"
+
+
+def _bucket(seconds):
+    if seconds <= SKETCH_MIN_SECONDS:
+        return _ZERO_BUCKET
+    return str(math.ceil(math.log(seconds) / _LOG_GAMMA))
+
+
+def _bucket_value(bucket):
+    if bucket == _ZERO_BUCKET:
+        return 0.0
+    return 2 * _GAMMA ** int(bucket) / (_GAMMA + 1)
+
+
+def _parse_timestamp(value):
+    try:
+        return datetime.datetime.fromisoformat(value.rstrip("Z"))
+    except (AttributeError, ValueError):
+        return datetime.datetime.utcnow()
+
+
+def _hour_key(moment):
+    return f"{PREFIX}:hourly:{moment:%Y%m%d%H}"
+
+
+def _day_key(moment):
+    return f"{PREFIX}:daily:{moment:%Y%m%d}"
+
+
+def record_task(metadata, pipe=None):
+    """Fold one completed task into every rollup."""
+    own_pipe = pipe is None
+    if own_pipe:
+        pipe = redis_client.pipeline(transaction=False)
+    duration = float(metadata.get("duration_seconds") or 0)
+    chars = len(metadata.get("text", ""))
+    moment = _parse_timestamp(metadata.get("timestamp"))
+
+    pipe.hincrby(f"{PREFIX}:totals", "tasks", 1)
+    pipe.hincrby(f"{PREFIX}:totals", "chars", chars)
+    pipe.hincrbyfloat(f"{PREFIX}:totals", "duration_sum", duration)
+    for name, field in DIMENSIONS.items():
+        pipe.hincrby(f"{PREFIX}:by_{name}", metadata.get(field) or "unknown", 1)
+
+    age = (datetime.datetime.utcnow() - moment).total_seconds()
+    for key, ttl in ((_hour_key(moment), HOURLY_RETENTION_HOURS * 3600),
+                     (_day_key(moment), DAILY_RETENTION_DAYS * 86400)):
+        if age > ttl:
+            # Replayed history older than the series retention
+            continue
+        pipe.hincrby(key, "tasks", 1)
+        pipe.hincrby(key, "chars", chars)
+        pipe.hincrbyfloat(key, "duration_sum", duration)
+        pipe.hincrby(f"{key}:latency", _bucket(duration), 1)
+        pipe.expire(key, ttl)
+        pipe.expire(f"{key}:latency", ttl)
+    pipe.hincrby(f"{PREFIX}:latency", _bucket(duration), 1)
+
+    if own_pipe:
+        pipe.execute()
+
+
+def percentiles(sketch, quantiles=PERCENTILES):
+    """Estimate quantiles from a {bucket: count} sketch."""
+    counts = sorted(
+        ((_bucket_value(b.decode() if isinstance(b, bytes) else b), int(n))
+         for b, n in sketch.items()),
+        key=lambda item: item[0]
+    )
+    total = sum(n for _, n in counts)
+    if not total:
+        return {f"p{int(q * 100)}": None for q in quantiles}
+    result = {}
+    for q in quantiles:
+        rank, seen = q * (total - 1), 0
+        for value, n in counts:
+            seen += n
+            if seen > rank:
+                result[f"p{int(q * 100)}"] = round(value, 3)
+                break
+    return result
+
+
+def _decode(mapping):
+    return {k.decode(): v.decode() for k, v in mapping.items()}
+
+
+def _series_point(label, raw):
+    tasks = int(raw.get("tasks", 0))
+    return {
+        "period": label,
+        "tasks": tasks,
+        "chars": int(raw.get("chars", 0)),
+        "avg_duration": round(float(raw.get("duration_sum", 0)) / tasks, 2) if tasks else 0,
+    }
+
+
+def snapshot(hours=24, days=30, now=None):
+    """Everything the analytics page shows, in one pipelined round-trip."""
+    now = now or datetime.datetime.utcnow()
+    hour_moments = [now - datetime.timedelta(hours=i) for i in reversed(range(hours))]
+    day_moments = [now - datetime.timedelta(days=i) for i in reversed(range(days))]
+
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hgetall(f"{PREFIX}:totals")
+    for name in DIMENSIONS:
+        pipe.hgetall(f"{PREFIX}:by_{name}")
+    pipe.hgetall(f"{PREFIX}:latency")
+    pipe.hgetall(f"{_day_key(now)}:latency")
+    for moment in hour_moments:
+        pipe.hgetall(_hour_key(moment))
+    for moment in day_moments:
+        pipe.hgetall(_day_key(moment))
+    replies = iter(pipe.execute())
+
+    totals = _decode(next(replies))
+    breakdowns = {name: {k: int(v) for k, v in _decode(next(replies)).items()}
+                  for name in DIMENSIONS}
+    latency_all = next(replies)
+    latency_today = next(replies)
+    hourly = [_series_point(f"{m:%Y-%m-%d %H:00}", _decode(next(replies))) for m in hour_moments]
+    daily = [_series_point(f"{m:%Y-%m-%d}", _decode(next(replies))) for m in day_moments]
+
+    total_tasks = int(totals.get("tasks", 0))
+    total_chars = int(totals.get("chars", 0))
+    duration_sum = float(totals.get("duration_sum", 0))
+    return {
+        "total_tasks": total_tasks,
+        "total_chars": total_chars,
+        "avg_chars": round(total_chars / total_tasks) if total_tasks else 0,
+        "avg_duration": round(duration_sum / total_tasks, 2) if total_tasks else 0,
+        "formats": breakdowns["format"],
+        "voices": breakdowns["voice"],
+        "emotions": breakdowns["emotion"],
+        "latency": percentiles(latency_all),
+        "latency_today": percentiles(latency_today),
+        "hourly": hourly,
+        "daily": daily,
+    }
+
+
+def rebuild(batch_size=1000):
+    """Drop all rollups and replay them from the task index."""
+    import task_index
+
+    for key in redis_client.scan_iter(f"{PREFIX}:*"):
+        redis_client.delete(key)
+
+    pipe = redis_client.pipeline(transaction=False)
+    replayed, cursor = 0, None
+    while True:
+        tasks, cursor = task_index.query_tasks(descending=False, cursor=cursor, limit=batch_size)
+        for metadata in tasks:
+            record_task(metadata, pipe)
+        pipe.execute()
+        replayed += len(tasks)
+        if cursor is None:
+            break
+    logging.info("Rebuilt analytics rollups from %d tasks", replayed)
+    return replayed
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "rebuild":
+        sys.exit("usage: python analytics_rollups.py rebuild")
+    print(f"Rebuilt analytics rollups from {rebuild()} task(s)")
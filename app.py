@@ -1,18 +1,194 @@
 from celery import Celery
-import datetime, io, os, logging, json, uuid
-from pydub import AudioSegment
-import requests
+from celery.signals import before_task_publish
+import datetime, os, logging, json, queue, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+import redis
 from dotenv import load_dotenv
+from flask_socketio import SocketIO, join_room
 
-# Load environment variables and API key
+# Load environment variables before the modules below read their settings
+# (tts_client takes the API key and URL from here)
 load_dotenv()
-ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
+
+import analytics_rollups
+import audio_descriptors
+import batch_progress
+import derivatives
+import lanes
+import long_text
+import metrics
+import renditions as renditions_module
+import single_flight
+import storage
+import synthesis_cache
+import task_index
+import transcode
+import tts_client
+import voices_catalog
+import worker_pool
 
 # Directories for outputs and metadata
-OUTPUT_DIR = "output_audio"
-METADATA_DIR = "tasks_metadata"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-os.makedirs(METADATA_DIR, exist_ok=True)
+# Sharded layout and quota live in storage.py
+OUTPUT_DIR = storage.OUTPUT_DIR
+METADATA_DIR = storage.METADATA_DIR
+
+# Flask application with real-time feedback and metrics endpoint
+from flask import Flask, Response, render_template, request, send_file, jsonify, url_for, redirect
+
+app = Flask(__name__)
+app.config['SECRET_KEY'] = 'secret!'
+
+# Audio delivery: AUDIO_OFFLOAD=x-sendfile (Apache/lighttpd) or x-accel (nginx,
+# with AUDIO_ACCEL_PREFIX mapped to OUTPUT_DIR) hands the transfer to the front end
+AUDIO_MIMETYPES = {
+    'mp3': 'audio/mpeg', 'wav': 'audio/wav', 'ogg': 'audio/ogg', 'oga': 'audio/ogg',
+    'opus': 'audio/ogg', 'flac': 'audio/flac', 'aac': 'audio/aac', 'm4a': 'audio/mp4',
+    'webm': 'audio/webm'
+}
+AUDIO_MAX_AGE = 365 * 24 * 3600
+AUDIO_OFFLOAD = os.getenv('AUDIO_OFFLOAD', '').lower()
+AUDIO_ACCEL_PREFIX = os.getenv('AUDIO_ACCEL_PREFIX', '/protected_audio/')
+# Seconds a client is told to wait before asking again for a rendition being encoded
+RENDITION_RETRY_AFTER = 2
+app.config['USE_X_SENDFILE'] = AUDIO_OFFLOAD == 'x-sendfile'
+socketio = SocketIO(app, message_queue='redis://localhost:6379/0')
+
+# Configure Celery with Redis (broker and result backend)
+celery_app = Celery('tasks', broker='redis://localhost:6379/0', backend='redis://localhost:6379/1')
+# CELERY_TASK_ALWAYS_EAGER=1 runs tasks inline (benchmarks, debugging); results
+# are still stored so the status endpoints behave the same
+if os.getenv('CELERY_TASK_ALWAYS_EAGER', '').lower() in ('1', 'true'):
+    celery_app.conf.task_always_eager = True
+    celery_app.conf.task_store_eager_result = True
+# Everything defaults to the interactive lane; batch items are sent to the
+# batch queue explicitly. Workers consume queues in -Q order, so one listening
+# on both (-Q interactive,batch) drains interactive first.
+celery_app.conf.task_default_queue = lanes.INTERACTIVE_QUEUE
+celery_app.conf.broker_transport_options = {'queue_order_strategy': 'priority'}
+# Storage compaction runs under `celery -A app.celery_app beat`
+STORAGE_GC_INTERVAL = int(os.getenv("STORAGE_GC_INTERVAL", 3600))
+BATCH_LANE_PUMP_INTERVAL = int(os.getenv("BATCH_LANE_PUMP_INTERVAL", 60))
+celery_app.conf.beat_schedule = {
+    'storage-gc': {'task': 'storage_gc', 'schedule': STORAGE_GC_INTERVAL,
+                   'options': {'queue': lanes.BATCH_QUEUE}},
+    'batch-lane-pump': {'task': 'batch_lane_pump', 'schedule': BATCH_LANE_PUMP_INTERVAL,
+                        'options': {'queue': lanes.INTERACTIVE_QUEUE}},
+}
+redis_client = redis.Redis.from_url('redis://localhost:6379/0')
+
+# Streaming synthesis: pending stream requests, relay chunk size and the
+# provider's optional latency/quality trade-off (0-4, unset = provider default)
+STREAM_REQUEST_TTL = 300
+STREAM_CHUNK_BYTES = 4096
+STREAM_LATENCY_OPTIMIZATION = os.getenv("STREAM_LATENCY_OPTIMIZATION")
+
+# Emit-only Socket.IO client: workers publish task events through the Redis
+# message queue and the web process relays them to the subscribed room
+task_events = SocketIO(message_queue='redis://localhost:6379/0')
+
+@before_task_publish.connect
+def stamp_enqueue_time(headers=None, **kwargs):
+    """Stamp every message so workers can measure how long it waited in the broker."""
+    if headers is not None:
+        headers['enqueued_at'] = time.time()
+
+# Batch fan-out state expires along with the Celery results it points at
+BATCH_STATE_TTL = 24 * 3600
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, filename='app.log', format='%(asctime)s %(levelname)s: %(message)s')
+
+
+def safe_filename(prefix="output", ext="mp3"):
+    """Generate a timestamped, unique filename in its storage shard."""
+    return storage.new_audio_path(prefix, ext)
+
+
+def emit_task_event(task_id, event, payload):
+    """Push a task event to the Socket.IO room named after the task id."""
+    try:
+        task_events.emit(event, payload, to=task_id)
+    except Exception:
+        logging.exception("Failed to emit %s for task %s", event, task_id)
+
+
+def save_task_metadata(task_id, metadata):
+    """Persist a task's metadata as JSON and return the file path."""
+    metadata_path = storage.write_metadata(task_id, metadata)
+    try:
+        task_index.index_task(metadata)
+    except Exception:
+        logging.exception("Failed to index task metadata %s", task_id)
+    try:
+        analytics_rollups.record_task(metadata)
+    except Exception:
+        logging.exception("Failed to update analytics rollups for %s", task_id)
+    return metadata_path
+
+
+def request_tts_audio(text, voice_id, voice_settings):
+    """Call the ElevenLabs text-to-speech endpoint and return the mp3 bytes."""
+    logging.info("Requesting TTS API: %s", {"text": text, "voice_settings": voice_settings})
+    return tts_client.get_client().synthesize(text, voice_id, voice_settings)
+
+
+def open_tts_stream(text, voice_id, voice_settings):
+    """Start a streaming synthesis; the caller iterates the chunked mp3 response."""
+    params = {}
+    if STREAM_LATENCY_OPTIMIZATION:
+        params["optimize_streaming_latency"] = STREAM_LATENCY_OPTIMIZATION
+    logging.info("Requesting streaming TTS API: %s", {"text": text, "voice_settings": voice_settings})
+    return tts_client.get_client().open_stream(text, voice_id, voice_settings, params)
+
+
+def synthesize_long_text(text, voice_id, voice_settings):
+    """
+    Synthesize sentence-aligned chunks concurrently; returns the mp3 bytes in
+    order, ready for long_text.render_chunks, and per-chunk timings.
+    """
+    chunks = long_text.split_text(text)
+    timer = metrics.current_timer() or metrics.StageTimer()
+
+    def synthesize_chunk(index):
+        started = time.monotonic()
+        with metrics.track(timer):
+            audio_bytes = request_tts_audio(chunks[index], voice_id, voice_settings)
+        timing = {
+            "index": index,
+            "chars": len(chunks[index]),
+            "seconds": round(time.monotonic() - started, 3)
+        }
+        return audio_bytes, timing
+
+    workers = max(1, min(long_text.LONG_TEXT_CONCURRENCY, len(chunks)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(synthesize_chunk, range(len(chunks))))
+
+    return [audio_bytes for audio_bytes, _ in results], [timing for _, timing in results]
+
+
+def _record_task_metrics(timer, started, status, cached, retries):
+    try:
+        metrics.record_task(timer.as_dict(), time.perf_counter() - started, status,
+                            cache_hit=bool(cached), retries=retries)
+    except Exception:
+        logging.exception("Failed to record task metrics")
+
+
+def _record_lane_wait(task_request, enqueued_at):
+    """Submission-to-start wait per lane; first attempts only, retries wait on purpose."""
+    if task_request.retries:
+        return
+    lane = task_request.get('lane') or lanes.INTERACTIVE_QUEUE
+    since = task_request.get('lane_enqueued_at') or enqueued_at
+    if not since:
+        return
+    try:
+        metrics.observe("tts_queue_wait_seconds", max(0.0, time.time() - float(since)),
+                        {"lane": lane})
+    except Exception:
+        logging.exception("Failed to record lane wait")
+
 
 # Add at top of app.py
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
@@ -70,21 +246,29 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    # Retrieve task history from saved metadata files
-    tasks = []
-    for filename in os.listdir(METADATA_DIR):
-        if filename.endswith('.json'):
-            try:
-                with open(os.path.join(METADATA_DIR, filename), 'r') as f:
-                    task_data = json.load(f)
-                    tasks.append(task_data)
-            except Exception as e:
-                logging.error(f"Error loading task metadata: {e}")
-    
-    # Sort tasks by timestamp, newest first
-    tasks.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
+    # Filter, sort and paginate task history in the SQLite task index
+    filters = {
+        'voice_id': request.args.get('voice') or None,
+        'audio_format': request.args.get('format') or None,
+        'date_from': request.args.get('date_from') or None,
+        'date_to': request.args.get('date_to') or None,
+    }
+    sort = request.args.get('sort', 'timestamp')
+    if sort not in task_index.SORT_COLUMNS:
+        sort = 'timestamp'
+    descending = request.args.get('order', 'desc') != 'asc'
+    try:
+        tasks, next_cursor = task_index.query_tasks(
+            sort=sort, descending=descending,
+            cursor=request.args.get('cursor') or None, **filters
+        )
+    except ValueError:
+        return redirect(url_for('dashboard'))
     
-    return render_template('dashboard.html', tasks=tasks)
+    return render_template('dashboard.html', tasks=tasks, next_cursor=next_cursor,
+                           filters=filters, sort=sort, descending=descending,
+                           voice_ids=task_index.distinct_values('voice_id'),
+                           formats=task_index.distinct_values('format'))
 
 # Add to app.py
 # Storage for user voice presets
@@ -145,22 +329,111 @@ def use_preset(preset_id):
     return render_template('index.html.j2', voices=voices, preset=preset)
 
 # Add to app.py
+def _batch_key(batch_id):
+    return f"batch:{batch_id}"
+
+def _batch_meta(batch_id):
+    """Parameters and owner of a batch; texts and task ids are read per item."""
+    raw = redis_client.hgetall(_batch_key(batch_id))
+    if not raw:
+        return None
+    meta = {k.decode(): v.decode() for k, v in raw.items()}
+    meta['params'] = json.loads(meta['params'])
+    return meta
+
+def _dispatch_batch_item(batch_id, batch, index):
+    """Queue one batch item on the batch lane; its completion releases the next."""
+    key = _batch_key(batch_id)
+    text = redis_client.lindex(f"{key}:texts", index).decode()
+    task_id = redis_client.lindex(f"{key}:task_ids", index).decode()
+    # Recorded before publishing so it can never land after the outcome
+    item = batch_progress.update(batch_id, index, 'QUEUED', BATCH_STATE_TTL,
+                                 text=text, task_id=task_id)
+    emit_task_event(batch_id, 'batch_item', {'batch_id': batch_id, 'item': item})
+    params = batch['params']
+    # Bookkeeping for batch work stays off the interactive lane as well
+    done = batch_item_finished.si(batch_id, batch['user_id'], index).set(queue=lanes.BATCH_QUEUE)
+    async_synthesize_and_save.apply_async(
+        (text, params['voice_id'], params['emotion_level'],
+         params['stability'], params['similarity_boost'], params['pitch'],
+         params['rate'], params['audio_format']),
+        task_id=task_id,
+        queue=lanes.BATCH_QUEUE,
+        # Lane wait is measured from submission, including fair-share hold time
+        headers={'lane': lanes.BATCH_QUEUE, 'lane_enqueued_at': float(batch['submitted_at']),
+                 'lane_item': [batch['user_id'], batch_id, index]},
+        link=done, link_error=done
+    )
+
+def _pump_batch_lane():
+    """Dispatch whatever the fair-share scheduler allows to start now."""
+    batches = {}
+    for user_id, batch_id, index in lanes.next_items():
+        if batch_id not in batches:
+            batches[batch_id] = _batch_meta(batch_id)
+        if batches[batch_id] is None:
+            # Batch state expired; free the slot it was given
+            lanes.item_finished(user_id, batch_id, index)
+            continue
+        _dispatch_batch_item(batch_id, batches[batch_id], index)
+
 @celery_app.task(bind=True)
 def process_batch(self, text_list, voice_id, emotion_level, 
-                 stability, similarity_boost, pitch, rate, audio_format):
-    """Process a batch of text entries"""
-    results = []
-    for text in text_list:
-        try:
-            result = async_synthesize_and_save(
-                text, voice_id, emotion_level, 
-                stability, similarity_boost, pitch, rate, audio_format
-            )
-            results.append({"text": text, "result": result})
-        except Exception as e:
-            results.append({"text": text, "error": str(e)})
-    
-    return results
+                 stability, similarity_boost, pitch, rate, audio_format,
+                 user_id=None):
+    """Register a batch with the fair-share batch lane and start what fits"""
+    batch_id = self.request.id or uuid.uuid4().hex
+    key = _batch_key(batch_id)
+    user_id = str(user_id or 'anonymous')
+    params = {
+        'voice_id': voice_id, 'emotion_level': emotion_level,
+        'stability': stability, 'similarity_boost': similarity_boost,
+        'pitch': pitch, 'rate': rate, 'audio_format': audio_format
+    }
+    pipe = redis_client.pipeline()
+    pipe.hset(key, mapping={'user_id': user_id, 'submitted_at': time.time(),
+                            'total': len(text_list), 'params': json.dumps(params)})
+    if text_list:
+        pipe.rpush(f"{key}:texts", *text_list)
+        pipe.rpush(f"{key}:task_ids", *[str(uuid.uuid4()) for _ in text_list])
+    for suffix in ('', ':texts', ':task_ids'):
+        pipe.expire(f"{key}{suffix}", BATCH_STATE_TTL)
+    pipe.execute()
+    batch_progress.init(batch_id, len(text_list), BATCH_STATE_TTL)
+    if text_list:
+        lanes.enqueue_batch(user_id, batch_id, len(text_list))
+        _pump_batch_lane()
+
+    # Item state lives in batch_progress; the result stays small
+    return {"batch_id": batch_id, "total": len(text_list)}
+
+@celery_app.task
+def batch_item_finished(batch_id, user_id=None, index=None):
+    """Completion hook of a batch item: record its outcome and refill the batch lane"""
+    if user_id is not None and index is not None:
+        lanes.item_finished(user_id, batch_id, index)
+    if index is not None:
+        task_id = redis_client.lindex(f"{_batch_key(batch_id)}:task_ids", index)
+        if task_id is not None:
+            task_id = task_id.decode()
+            result = async_synthesize_and_save.AsyncResult(task_id)
+            if result.state == 'SUCCESS':
+                item = batch_progress.update(batch_id, index, 'SUCCESS', BATCH_STATE_TTL,
+                                             task_id=task_id, result=result.result)
+            else:
+                item = batch_progress.update(batch_id, index, 'FAILURE', BATCH_STATE_TTL,
+                                             task_id=task_id, error=str(result.result))
+            counts = batch_progress.counts(batch_id)
+            emit_task_event(batch_id, 'batch_item', {'batch_id': batch_id, 'item': item})
+            emit_task_event(batch_id, 'batch_progress', dict(counts, batch_id=batch_id))
+            if counts['pending'] == 0:
+                emit_task_event(batch_id, 'batch_complete', dict(counts, batch_id=batch_id))
+    _pump_batch_lane()
+
+@celery_app.task(name='batch_lane_pump')
+def batch_lane_pump():
+    """Periodic refill, so slots whose items were lost come back into use once their leases expire"""
+    _pump_batch_lane()
 
 @app.route('/batch', methods=['GET', 'POST'])
 @login_required
@@ -188,8 +461,10 @@ def batch_processing():
             text_list = [batch_text]
         
         # Start batch processing task
-        task = process_batch.delay(
-            text_list, voice, emotion, 0.75, 0.75, pitch, rate, fmt
+        task = process_batch.apply_async(
+            (text_list, voice, emotion, 0.75, 0.75, pitch, rate, fmt),
+            {'user_id': current_user.id},
+            queue=lanes.BATCH_QUEUE
         )
         
         return render_template(
@@ -204,113 +479,126 @@ def batch_processing():
 @app.route('/batch_status/<task_id>')
 @login_required
 def batch_status(task_id):
-    result = process_batch.AsyncResult(task_id)
-    
-    if result.state == 'SUCCESS':
-        return jsonify({'status': 'SUCCESS', 'results': result.result})
-    elif result.state == 'FAILURE':
-        return jsonify({'status': 'FAILURE'})
-    else:
-        return jsonify({'status': 'PENDING'})
+    """
+    Counts plus the items that changed after ?cursor=, at most ?limit= of
+    them; keep fetching with the returned cursor while has_more is true.
+    """
+    counts = batch_progress.counts(task_id)
+    if counts is None:
+        # Not registered yet, or the batch task itself failed
+        if process_batch.AsyncResult(task_id).state == 'FAILURE':
+            return jsonify({'status': 'FAILURE'})
+        return jsonify({'status': 'PENDING', 'items': [], 'cursor': 0, 'has_more': False})
+
+    cursor = request.args.get('cursor', 0, type=int)
+    limit = request.args.get('limit', batch_progress.PAGE_SIZE, type=int)
+    items, next_cursor, has_more = batch_progress.changes(task_id, cursor, limit)
+    return jsonify({
+        'status': 'PENDING' if counts['pending'] else 'SUCCESS',
+        'total': counts['total'],
+        'completed': counts['completed'],
+        'failed': counts['failed'],
+        'pending': counts['pending'],
+        'items': items,
+        'cursor': next_cursor,
+        'has_more': has_more,
+    })
 # Add to app.py
 @app.route('/analytics')
 @login_required
 def analytics():
-    # Load all task metadata
-    tasks = []
-    for filename in os.listdir(METADATA_DIR):
-        if filename.endswith('.json'):
-            try:
-                with open(os.path.join(METADATA_DIR, filename), 'r') as f:
-                    task_data = json.load(f)
-                    tasks.append(task_data)
-            except Exception as e:
-                logging.error(f"Error loading task metadata: {e}")
-    
-    # Calculate analytics
-    total_tasks = len(tasks)
-    if total_tasks == 0:
+    # Rollups are maintained as tasks complete, so this is constant time
+    analytics_data = analytics_rollups.snapshot()
+    if analytics_data['total_tasks'] == 0:
         return render_template('analytics.html', no_data=True)
     
-    formats = {}
-    emotions = {}
-    avg_duration = 0
-    total_chars = 0
-    
-    for task in tasks:
-        fmt = task.get('format', 'unknown')
-        formats[fmt] = formats.get(fmt, 0) + 1
-        
-        text = task.get('text', '')
-        total_chars += len(text)
-        
-        duration = task.get('duration_seconds', 0)
-        avg_duration += duration
-    
-    if total_tasks > 0:
-        avg_duration /= total_tasks
-        avg_chars = total_chars / total_tasks
-    else:
-        avg_duration = 0
-        avg_chars = 0
-    
-    analytics_data = {
-        'total_tasks': total_tasks,
-        'formats': formats,
-        'avg_duration': round(avg_duration, 2),
-        'avg_chars': round(avg_chars),
-        'total_chars': total_chars
-    }
-    
     return render_template('analytics.html', data=analytics_data)
 # Add to app.py
 @celery_app.task(bind=True)
-def advanced_audio_processing(self, audio_filename, effects):
+def advanced_audio_processing(self, audio_filename, effects, output_filename=None,
+                              derivative_key=None, source_task_id=None):
     """Apply post-processing effects to an audio file"""
     try:
-        audio = AudioSegment.from_file(audio_filename)
-        
-        # Apply volume adjustment
-        if 'volume' in effects:
-            volume_db = effects['volume']
-            audio = audio + volume_db
-        
-        # Apply fade in/out
-        if 'fade_in' in effects:
-            fade_in_ms = effects['fade_in']
-            audio = audio.fade_in(fade_in_ms)
-        
-        if 'fade_out' in effects:
-            fade_out_ms = effects['fade_out']
-            audio = audio.fade_out(fade_out_ms)
-        
-        # Apply speed change (without affecting pitch)
-        if 'speed' in effects:
-            speed_factor = effects['speed']
-            audio = audio._spawn(audio.raw_data, overrides={
-                "frame_rate": int(audio.frame_rate * speed_factor)
-            }).set_frame_rate(audio.frame_rate)
-        
-        # Apply normalization
-        if effects.get('normalize', False):
-            audio = audio.normalize()
-        
-        # Save processed file
-        output_filename = audio_filename.replace(".mp3", "_processed.mp3")
-        audio.export(output_filename, format="mp3")
+        if output_filename is None:
+            output_filename = audio_filename.replace(".mp3", "_processed.mp3")
+        # Decode once, run the whole chain in NumPy (pitch-preserving speed,
+        # loudness normalization), describe the result, encode once
+        descriptors = worker_pool.run_cpu(audio_descriptors.process_and_describe,
+                                          audio_filename, output_filename, effects, "mp3")
+        if source_task_id:
+            _record_processed_descriptors(source_task_id, output_filename, effects, descriptors)
+        if derivative_key:
+            derivatives.release_job(derivative_key)
         
         return output_filename
     
     except Exception as e:
         logging.exception(f"Error processing audio: {e}")
+        if derivative_key and self.request.retries >= self.max_retries:
+            derivatives.release_job(derivative_key)
         raise self.retry(exc=e, countdown=5)
 
+def _record_processed_descriptors(task_id, output_filename, effects, descriptors):
+    """Keep a derivative's descriptors with the task it was processed from."""
+    try:
+        metadata = storage.read_metadata(task_id)
+        if metadata is None:
+            return
+        metadata.setdefault("processed", {})[os.path.basename(output_filename)] = {
+            "effects": effects,
+            "descriptors": descriptors,
+        }
+        storage.write_metadata(task_id, metadata)
+        task_index.index_task(metadata)
+    except Exception:
+        logging.exception("Failed to record descriptors of %s on task %s", output_filename, task_id)
+
+@celery_app.task(name='produce_rendition')
+def produce_rendition(source, spec):
+    """Encode a rendition first asked for through /audio, off the web request"""
+    try:
+        # Decode and encode are CPU-bound: off the I/O threads in threads mode
+        return worker_pool.run_cpu(renditions_module.ensure, source, spec)
+    except Exception as e:
+        # Undecodable source or failed encode: retrying right away fails the same way
+        logging.exception("Failed to transcode %s to %s", source, spec)
+        reason = ("Transcoding failed" if isinstance(e, transcode.TranscodeError)
+                  else "Could not decode source audio")
+        renditions_module.mark_failed(source, spec, reason)
+    finally:
+        renditions_module.release_job(source, spec)
+
+@celery_app.task(name='describe_output')
+def describe_output(task_id, filename, key):
+    """Descriptors of output the synthesis never decoded, streamed off the hot path"""
+    try:
+        descriptors = audio_descriptors.recall(key)
+        if descriptors is None:
+            descriptors = worker_pool.run_cpu(audio_descriptors.describe_file, filename)
+            audio_descriptors.remember(key, descriptors)
+        metadata = storage.read_metadata(task_id)
+        if metadata is None:
+            return
+        metadata.pop("descriptors_pending", None)
+        metadata["descriptors"] = descriptors
+        storage.write_metadata(task_id, metadata)
+        task_index.index_task(metadata)
+    except Exception:
+        logging.exception("Failed to describe %s for task %s", filename, task_id)
+
+@celery_app.task(name='storage_gc')
+def storage_gc():
+    """Evict audio over quota, then derivatives whose source went with it"""
+    result = storage.gc()
+    result['derivatives_evicted'] = derivatives.evict()
+    return result
+
 @app.route('/process_audio/<task_id>', methods=['GET', 'POST'])
 @login_required
 def process_audio(task_id):
     # Get the original audio filename
-    path = os.path.join(METADATA_DIR, f"{task_id}.json")
-    if not os.path.exists(path):
+    path = storage.find_metadata(task_id)
+    if path is None:
         return jsonify({'error': 'Task metadata not found'}), 404
     
     with open(path, 'r') as f:
@@ -327,12 +615,32 @@ def process_audio(task_id):
         if request.form.get('speed'):
             effects['speed'] = float(request.form.get('speed', 1.0))
         
-        # Start processing task
-        task = advanced_audio_processing.delay(metadata['output_file'], effects)
+        # Identical source + effects map to one derivative file
+        source = storage.locate_audio(os.path.basename(metadata['output_file']))
+        if source is None:
+            return jsonify({'error': 'Audio has been evicted from storage'}), 410
+        key = derivatives.derivative_key(source, effects)
+        output_filename = derivatives.derivative_path(source, key)
+        if os.path.exists(output_filename):
+            derivatives.touch(output_filename)
+            return render_template('processing.html',
+                                  audio_file=source,
+                                  processed_file=output_filename)
+        
+        # Concurrent identical requests share the job that claimed the key first
+        candidate_id = str(uuid.uuid4())
+        job_id = derivatives.claim_job(key, candidate_id)
+        if job_id == candidate_id:
+            advanced_audio_processing.apply_async(
+                (source, effects),
+                {'output_filename': output_filename, 'derivative_key': key,
+                 'source_task_id': task_id},
+                task_id=job_id
+            )
         
         return render_template('processing.html', 
-                              audio_file=metadata['output_file'],
-                              processing_task_id=task.id)
+                              audio_file=source,
+                              processing_task_id=job_id)
     
     return render_template('processing.html', audio_file=metadata['output_file'])
 
@@ -348,20 +656,6 @@ def processing_status(task_id):
     else:
         return jsonify({'status': 'PENDING'})
 
-# Configure Celery with Redis (broker and result backend)
-celery_app = Celery('tasks', broker='redis://localhost:6379/0', backend='redis://localhost:6379/1')
-
-# Configure logging
-logging.basicConfig(level=logging.INFO, filename='app.log', format='%(asctime)s %(levelname)s: %(message)s')
-
-
-def safe_filename(prefix="output", ext="mp3"):
-    """Generate a timestamped, unique filename."""
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    unique_id = uuid.uuid4().hex[:8]
-    return os.path.join(OUTPUT_DIR, f"{prefix}_{timestamp}_{unique_id}.{ext}")
-
-
 @celery_app.task(bind=True, max_retries=3)
 def async_synthesize_and_save(self, text, voice_id,
                               emotion_level="neutral",
@@ -369,35 +663,128 @@ def async_synthesize_and_save(self, text, voice_id,
                               similarity_boost=0.75,
                               pitch=1.0,
                               rate=1.0,
-                              audio_format="mp3"):
+                              audio_format="mp3",
+                              renditions=None):
     """
     Async task to synthesize text, record timing, save metadata, and support multiple formats.
+    Texts over LONG_TEXT_THRESHOLD characters are synthesized as parallel chunks.
+    renditions lists extra outputs ("wav", "mp3:64k", "ogg:96k@24000") encoded
+    from the result; the provider is still called once at most.
     """
-    url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
-    headers = {
-        "xi-api-key": ELEVENLABS_API_KEY,
-        "Content-Type": "application/json"
-    }
-    data = {
-        "text": text,
-        "voice_settings": {
-            "stability": stability,
-            "similarity_boost": similarity_boost,
-            "emotion": emotion_level,
-            "pitch": pitch,
-            "rate": rate
-        }
+    voice_settings = {
+        "stability": stability,
+        "similarity_boost": similarity_boost,
+        "emotion": emotion_level,
+        "pitch": pitch,
+        "rate": rate
     }
     start_time = datetime.datetime.utcnow()
+    key = synthesis_cache.cache_key(text, voice_id, emotion_level, stability,
+                                    similarity_boost, pitch, rate, audio_format)
+    # The provider's mp3 is cached as the master every other format derives from
+    master_key = synthesis_cache.cache_key(text, voice_id, emotion_level, stability,
+                                           similarity_boost, pitch, rate, transcode.SOURCE_FORMAT)
+    chunk_timings = None
+    descriptors = None
+    encode_path = "cache"
+    cached = None
+    timer = metrics.StageTimer()
+    started = time.perf_counter()
+    enqueued_at = self.request.get('enqueued_at') or (self.request.headers or {}).get('enqueued_at')
+    if enqueued_at:
+        timer.add("queue_wait", time.time() - float(enqueued_at))
+    _record_lane_wait(self.request, enqueued_at)
+    lane_item = self.request.get('lane_item')
+    if lane_item:
+        # Every attempt, retries included, keeps the batch lane slot leased
+        try:
+            lanes.renew(*lane_item)
+        except Exception:
+            logging.exception("Failed to renew batch lane lease")
+    emit_task_event(self.request.id, 'task_progress',
+                    {'task_id': self.request.id, 'status': 'STARTED',
+                     'retries': self.request.retries})
     try:
-        logging.info("Requesting TTS API: %s", data)
-        response = requests.post(url, json=data, headers=headers, timeout=30)
-        response.raise_for_status()
-
-        audio_bytes = response.content
-        audio = AudioSegment.from_file(io.BytesIO(audio_bytes), format="mp3")
         filename = safe_filename(prefix=voice_id, ext=audio_format)
-        audio.export(filename, format=audio_format)
+        with timer.stage("cache_lookup"):
+            cached = synthesis_cache.lookup(key, audio_format)
+        shared_from = None
+        if cached:
+            synthesis_cache.materialize(cached, filename)
+            logging.info("Synthesis cache hit %s -> %s", key, filename)
+        else:
+            def produce():
+                nonlocal cached, chunk_timings, descriptors, encode_path
+                # Inside the lease: a previous leader may have stored the
+                # result since our lookup, and the API must not be paid twice
+                with timer.stage("cache_recheck"):
+                    cached = synthesis_cache.lookup(key, audio_format, count=False)
+                if cached:
+                    synthesis_cache.materialize(cached, filename)
+                    encode_path = "cache"
+                    return filename
+                with metrics.track(timer):
+                    if len(text) > long_text.LONG_TEXT_THRESHOLD:
+                        mp3_chunks, chunk_timings = synthesize_long_text(text, voice_id, voice_settings)
+                        # Decode/stitch/encode is CPU-bound: off the I/O threads in threads mode
+                        stages, descriptors = worker_pool.run_cpu(long_text.render_chunks,
+                                                                  mp3_chunks, filename, audio_format)
+                        for stage, seconds in stages.items():
+                            timer.add(stage, seconds)
+                        # Before the result is published, so followers find them
+                        audio_descriptors.remember(key, descriptors)
+                        encode_path = "pydub"
+                    else:
+                        master = None
+                        if audio_format != transcode.SOURCE_FORMAT:
+                            master = synthesis_cache.lookup(master_key, transcode.SOURCE_FORMAT,
+                                                            count=False)
+                        if master:
+                            # Same speech already paid for in another format
+                            with open(master, 'rb') as f, timer.stage("encode"):
+                                transcode.save_audio(f.read(), filename, audio_format)
+                            encode_path = "master"
+                        else:
+                            # Provider bytes go to disk untouched, or through an ffmpeg pipe
+                            audio_bytes = request_tts_audio(text, voice_id, voice_settings)
+                            with timer.stage("encode"):
+                                encode_path = transcode.save_audio(audio_bytes, filename, audio_format)
+                            if audio_format != transcode.SOURCE_FORMAT:
+                                synthesis_cache.store_bytes(master_key, transcode.SOURCE_FORMAT,
+                                                            audio_bytes)
+                with timer.stage("cache_store"):
+                    synthesis_cache.store(key, audio_format, filename)
+                return filename
+
+            def on_wait(leader):
+                emit_task_event(self.request.id, 'task_progress',
+                                {'task_id': self.request.id, 'status': 'WAITING',
+                                 'leader': leader, 'retries': self.request.retries})
+
+            # Identical requests already in flight elsewhere are waited on, not re-synthesized
+            flight_started = time.perf_counter()
+            shared_file, leader = single_flight.run(key, self.request.id, produce, on_wait)
+            if leader != self.request.id:
+                timer.add("single_flight_wait", time.perf_counter() - flight_started)
+                synthesis_cache.materialize(shared_file, filename)
+                shared_from = leader
+                encode_path = "shared"
+                logging.info("Reused in-flight synthesis of %s by %s -> %s", key, leader, filename)
+
+        if descriptors is None:
+            # Cache hits and shared results were described when first produced
+            descriptors = audio_descriptors.recall(key)
+        describe = descriptors is None
+        rendition_files = None
+        if renditions:
+            # One decode, parallel encodes, off the I/O threads in threads mode
+            with timer.stage("renditions"):
+                rendition_files = worker_pool.run_cpu(renditions_module.encode_all,
+                                                      filename, renditions, describe)
+            if describe:
+                rendition_files, descriptors = rendition_files
+        if describe and descriptors is not None:
+            audio_descriptors.remember(key, descriptors)
 
         end_time = datetime.datetime.utcnow()
         duration = (end_time - start_time).total_seconds()
@@ -407,44 +794,67 @@ def async_synthesize_and_save(self, text, voice_id,
             "task_id": self.request.id,
             "text": text,
             "voice_id": voice_id,
+            "emotion": emotion_level,
             "format": audio_format,
             "duration_seconds": duration,
             "output_file": filename,
+            "cache_key": key,
+            "cache_hit": bool(cached),
+            "encode_path": encode_path,
+            "retries": self.request.retries,
+            "stage_seconds": timer.as_dict(),
             "timestamp": end_time.isoformat() + 'Z'
         }
-        metadata_path = os.path.join(METADATA_DIR, f"{self.request.id}.json")
-        with open(metadata_path, 'w') as mf:
-            json.dump(metadata, mf, indent=2)
+        if shared_from is not None:
+            metadata["shared_from_task"] = shared_from
+        if rendition_files:
+            metadata["renditions"] = rendition_files
+        if descriptors is not None:
+            metadata["descriptors"] = descriptors
+        else:
+            # Nothing decoded this audio (the mp3 fast path); describe it later
+            metadata["descriptors_pending"] = True
+        if chunk_timings is not None:
+            metadata["chunk_count"] = len(chunk_timings)
+            metadata["chunk_timings"] = chunk_timings
+        # The metadata write can only be timed after the fact, so it is
+        # reported to /metrics but not to the file it is writing
+        with timer.stage("metadata_write"):
+            metadata_path = save_task_metadata(self.request.id, metadata)
+        _record_task_metrics(timer, started, 'success', cached, self.request.retries)
 
         logging.info("Saved audio: %s and metadata: %s", filename, metadata_path)
+        if descriptors is None:
+            try:
+                describe_output.apply_async((self.request.id, filename, key),
+                                            queue=lanes.BATCH_QUEUE)
+            except Exception:
+                logging.exception("Failed to queue descriptors of %s", filename)
+        emit_task_event(self.request.id, 'task_complete',
+                        {'task_id': self.request.id, 'status': 'SUCCESS', 'result': filename})
         return filename
 
     except Exception as e:
         logging.exception("Error during synthesis: %s", e)
+        if self.request.retries >= self.max_retries:
+            _record_task_metrics(timer, started, 'failure', cached, self.request.retries)
+            emit_task_event(self.request.id, 'task_complete',
+                            {'task_id': self.request.id, 'status': 'FAILURE'})
+        else:
+            _record_task_metrics(timer, started, 'retry', cached, self.request.retries)
+            emit_task_event(self.request.id, 'task_progress',
+                            {'task_id': self.request.id, 'status': 'RETRY',
+                             'retries': self.request.retries + 1})
+        if isinstance(e, tts_client.RateLimitedError):
+            # The provider said when to come back; don't guess
+            raise self.retry(exc=e, countdown=e.retry_after)
         raise self.retry(exc=e, countdown=min(60, 2 ** self.request.retries * 5))
 
 
-# Flask application with real-time feedback and metrics endpoint
-from flask import Flask, render_template, request, send_file, jsonify, url_for
-from flask_caching import Cache
-from flask_socketio import SocketIO
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'secret!'
-socketio = SocketIO(app, message_queue='redis://localhost:6379/0')
-cache = Cache(app, config={'CACHE_TYPE': 'redis', 'CACHE_REDIS_URL': 'redis://localhost:6379/0'})
-
-@cache.cached(timeout=300, key_prefix='voices')
 def get_voices():
-    url = "https://api.elevenlabs.io/v1/voices"
-    headers = {"xi-api-key": ELEVENLABS_API_KEY}
-    try:
-        r = requests.get(url, headers=headers)
-        r.raise_for_status()
-        return r.json().get('voices', [])
-    except Exception:
-        logging.exception("Failed to fetch voices")
-        return []
+    # Served stale-while-revalidate; never waits on the provider
+    return voices_catalog.get_voices()
 
 @app.route('/', methods=['GET', 'POST'])
 def home():
@@ -456,21 +866,160 @@ def home():
         pitch = float(request.form.get('pitch', 1.0))
         rate = float(request.form.get('rate', 1.0))
         fmt = request.form.get('audio_format', 'mp3')
+        extra_renditions = [spec for spec in request.form.getlist('renditions') if spec != fmt]
 
         if not text:
             return render_template('index.html.j2', message="Please enter some text.", voices=voices)
+        try:
+            for spec in extra_renditions:
+                renditions_module.parse(spec)
+        except ValueError as e:
+            return render_template('index.html.j2', message=str(e), voices=voices)
+
+        if request.form.get('stream') == 'on':
+            stream_id = str(uuid.uuid4())
+            stream_request = {
+                'text': text, 'voice_id': voice, 'emotion_level': emotion,
+                'stability': 0.75, 'similarity_boost': 0.75,
+                'pitch': pitch, 'rate': rate
+            }
+            redis_client.set(f"stream:{stream_id}", json.dumps(stream_request),
+                             ex=STREAM_REQUEST_TTL)
+            return render_template('index.html.j2', message=f"Streaming audio (ID: {stream_id})",
+                                   stream_id=stream_id, voices=voices)
 
         task = async_synthesize_and_save.delay(text, voice, emotion,
                                               stability=0.75,
                                               similarity_boost=0.75,
                                               pitch=pitch,
                                               rate=rate,
-                                              audio_format=fmt)
+                                              audio_format=fmt,
+                                              renditions=extra_renditions or None)
         socketio.emit('task_queued', {'task_id': task.id})
         return render_template('index.html.j2', message=f"Task queued! (ID: {task.id})",
                                task_id=task.id, voices=voices)
     return render_template('index.html.j2', voices=voices, message=None)
 
+def _download_tts_stream(stream_id, params, chunks):
+    """
+    Write a streaming synthesis to disk while handing each chunk to the HTTP
+    relay. A cached synthesis is relayed from the cache instead; a fresh one is
+    written to a .part file, so a broken stream never leaves a truncated output.
+    """
+    voice_settings = {
+        "stability": params['stability'],
+        "similarity_boost": params['similarity_boost'],
+        "emotion": params['emotion_level'],
+        "pitch": params['pitch'],
+        "rate": params['rate']
+    }
+    start_time = datetime.datetime.utcnow()
+    started = time.monotonic()
+    first_byte = None
+    filename = safe_filename(prefix=params['voice_id'], ext='mp3')
+    part_filename = filename + '.part'
+    key = synthesis_cache.cache_key(params['text'], params['voice_id'],
+                                    params['emotion_level'], params['stability'],
+                                    params['similarity_boost'], params['pitch'],
+                                    params['rate'], 'mp3')
+    try:
+        cached = synthesis_cache.lookup(key, 'mp3')
+        if cached:
+            synthesis_cache.materialize(cached, filename)
+            with open(filename, 'rb') as f:
+                chunk = f.read(STREAM_CHUNK_BYTES)
+                while chunk:
+                    if first_byte is None:
+                        first_byte = time.monotonic() - started
+                    chunks.put(chunk)
+                    chunk = f.read(STREAM_CHUNK_BYTES)
+        else:
+            response = open_tts_stream(params['text'], params['voice_id'], voice_settings)
+            with response, open(part_filename, 'wb') as out:
+                for chunk in response.iter_content(chunk_size=STREAM_CHUNK_BYTES):
+                    if not chunk:
+                        continue
+                    if first_byte is None:
+                        first_byte = time.monotonic() - started
+                    out.write(chunk)
+                    chunks.put(chunk)
+            os.replace(part_filename, filename)
+            synthesis_cache.store(key, 'mp3', filename)
+        total = time.monotonic() - started
+
+        if cached:
+            stage_seconds = {"cache_relay": round(total, 6)}
+        else:
+            stage_seconds = {"http_ttfb": round(first_byte or 0, 6),
+                             "http_download": round(total - (first_byte or 0), 6)}
+        metadata = {
+            "task_id": stream_id,
+            "text": params['text'],
+            "voice_id": params['voice_id'],
+            "emotion": params['emotion_level'],
+            "format": "mp3",
+            "duration_seconds": total,
+            "time_to_first_byte_seconds": first_byte,
+            "stage_seconds": stage_seconds,
+            "streamed": True,
+            "output_file": filename,
+            "cache_key": key,
+            "cache_hit": bool(cached),
+            "timestamp": (start_time + datetime.timedelta(seconds=total)).isoformat() + 'Z'
+        }
+        save_task_metadata(stream_id, metadata)
+        logging.info("Streamed audio: %s (first byte after %.3fs, total %.3fs, cache %s)",
+                     filename, first_byte or 0, total, "hit" if cached else "miss")
+    except Exception:
+        logging.exception("Error during streaming synthesis %s", stream_id)
+        try:
+            os.remove(part_filename)
+        except FileNotFoundError:
+            pass
+    finally:
+        chunks.put(None)
+
+@app.route('/stream/<stream_id>')
+def stream_audio(stream_id):
+    raw = redis_client.getdel(f"stream:{stream_id}")
+    if raw is None:
+        return jsonify({'error': 'Stream not found or already consumed'}), 404
+
+    # The download runs in its own thread so the file and metadata are completed
+    # even if the listener disconnects part way through
+    chunks = queue.Queue()
+    threading.Thread(target=_download_tts_stream,
+                     args=(stream_id, json.loads(raw), chunks), daemon=True).start()
+
+    def relay():
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                break
+            yield chunk
+
+    return Response(relay(), mimetype='audio/mpeg', headers={'Cache-Control': 'no-store'})
+
+@socketio.on('subscribe')
+def subscribe_task(data):
+    """Join the room for a task or batch; replay the outcome if it already finished."""
+    task_id = (data or {}).get('task_id')
+    if not task_id:
+        return
+    join_room(task_id)
+    if (data or {}).get('kind') == 'batch':
+        counts = batch_progress.counts(task_id)
+        if counts is not None:
+            socketio.emit('batch_progress', dict(counts, batch_id=task_id), to=request.sid)
+        return
+    result = async_synthesize_and_save.AsyncResult(task_id)
+    if result.state == 'SUCCESS':
+        socketio.emit('task_complete', {'task_id': task_id, 'status': 'SUCCESS',
+                                        'result': result.result}, to=request.sid)
+    elif result.state == 'FAILURE':
+        socketio.emit('task_complete', {'task_id': task_id, 'status': 'FAILURE'},
+                      to=request.sid)
+
 @app.route('/task_status/<task_id>')
 def task_status(task_id):
     result = async_synthesize_and_save.AsyncResult(task_id)
@@ -480,16 +1029,105 @@ def task_status(task_id):
         return jsonify({'status': 'FAILURE'})
     return jsonify({'status': 'PENDING'})
 
+@app.route('/metrics')
+def metrics_exposition():
+    try:
+        for lane, values in lanes.stats().items():
+            for name, value in values.items():
+                metrics.set_gauge(f"tts_lane_{name}", value, {"lane": lane})
+    except Exception:
+        logging.exception("Failed to read lane depth")
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/metrics/<task_id>')
-def metrics(task_id):
-    path = os.path.join(METADATA_DIR, f"{task_id}.json")
-    if os.path.exists(path):
+def task_metrics(task_id):
+    path = storage.find_metadata(task_id)
+    if path is not None:
         return send_file(path, mimetype='application/json')
     return jsonify({'error': 'Metrics not found'}), 404
 
+@app.route('/descriptors/<task_id>')
+def task_descriptors(task_id):
+    """Duration, levels and waveform of a task's audio, without touching the file."""
+    metadata = task_index.get_task(task_id) or storage.read_metadata(task_id)
+    if metadata is not None and metadata.get('descriptors_pending'):
+        response = jsonify({'task_id': task_id, 'status': 'PENDING'})
+        response.status_code = 202
+        response.headers['Retry-After'] = '2'
+        return response
+    if metadata is None or 'descriptors' not in metadata:
+        return jsonify({'error': 'Descriptors not found'}), 404
+    response = jsonify({
+        'task_id': task_id,
+        'output_file': metadata.get('output_file'),
+        'descriptors': metadata['descriptors'],
+        'processed': {name: entry['descriptors']
+                      for name, entry in metadata.get('processed', {}).items()},
+    })
+    response.headers['Cache-Control'] = 'private, max-age=60'
+    return response
+
+@app.route('/cache_stats')
+def cache_stats():
+    return jsonify(synthesis_cache.stats())
+
 @app.route('/audio/<path:filename>')
 def serve_audio(filename):
-    return send_file(filename, mimetype='audio/mpeg', as_attachment=True)
+    # Only files under OUTPUT_DIR are served
+    output_root = os.path.realpath(OUTPUT_DIR)
+    path = os.path.realpath(filename)
+    if os.path.commonpath([output_root, path]) != output_root:
+        return jsonify({'error': 'Audio not found'}), 404
+    if not os.path.isfile(path):
+        # Links issued before the move to sharded storage name the flat path
+        moved = storage.locate_audio(os.path.basename(path))
+        if moved is None:
+            return jsonify({'error': 'Audio not found'}), 404
+        path = os.path.realpath(moved)
+
+    # ?rendition=ogg:96k serves another encoding, transcoded from this file once.
+    # The first request queues the encode and gets 202; clients retry after a bit
+    spec = request.args.get('rendition')
+    if spec:
+        try:
+            rendition = renditions_module.lookup(path, spec)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if rendition is None:
+            failure = renditions_module.failure(path, spec)
+            if failure is not None:
+                response = jsonify({'status': 'FAILURE', 'rendition': spec, 'error': failure})
+                response.status_code = 500
+                response.headers['Cache-Control'] = 'no-store'
+                return response
+            if renditions_module.claim_job(path, spec):
+                produce_rendition.delay(path, spec)
+            response = jsonify({'status': 'PENDING', 'rendition': spec})
+            response.status_code = 202
+            response.headers['Retry-After'] = str(RENDITION_RETRY_AFTER)
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+        path = os.path.realpath(rendition)
+    storage.touch(path)
+
+    ext = os.path.splitext(path)[1].lstrip('.').lower()
+    mimetype = AUDIO_MIMETYPES.get(ext, 'application/octet-stream')
+
+    if AUDIO_OFFLOAD == 'x-accel':
+        # nginx serves the bytes (ranges, sendfile); we only authorise and label them
+        relative = os.path.relpath(path, output_root).replace(os.sep, '/')
+        response = Response(status=200, mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = f"{AUDIO_ACCEL_PREFIX.rstrip('/')}/{relative}"
+        response.headers['Content-Disposition'] = f'attachment; filename="{os.path.basename(path)}"'
+    else:
+        # conditional=True gives Range/206, ETag and Last-Modified handling;
+        # the file itself goes out through wsgi.file_wrapper (sendfile) or X-Sendfile
+        response = send_file(path, mimetype=mimetype, as_attachment=True,
+                             conditional=True, max_age=AUDIO_MAX_AGE)
+    # Output files are never rewritten in place, so clients may cache them forever
+    response.headers['Cache-Control'] = f'public, max-age={AUDIO_MAX_AGE}, immutable'
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
 
 if __name__ == '__main__':
     socketio.run(app, debug=True, port=5001)
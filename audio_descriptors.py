@@ -0,0 +1,153 @@
+"""
+Compact descriptors of an output file, computed while its samples are already
+decoded and stored with the task metadata, so players and dashboards get the
+real duration, levels and a waveform without touching the audio:
+
+    {"duration_seconds": 12.41, "sample_rate": 44100, "channels": 1,
+     "peak_dbfs": -1.2, "rms_dbfs": -19.8, "loudness_lufs": -16.3,
+     "waveform": [0.012, 0.31, ...]}
+
+Levels of silent audio are null. Descriptors are also kept in Redis under the
+synthesis cache key, so cache hits and shared results reuse them undecoded.
+
+Samples are summarised a block at a time. Output that no step decoded is
+described after the task completes, by a batch-queue task that streams the
+file's PCM from ffmpeg and never holds it whole in memory.
+"""
+import json, logging, os
+import numpy as np
+import redis
+import audio_effects
+import transcode
+
+# Points in the downsampled waveform (peak of |sample| per bucket, 0..1)
+WAVEFORM_POINTS = int(os.getenv("WAVEFORM_POINTS", 200))
+# Frames decoded per block when describing a file
+DESCRIBE_BLOCK_SECONDS = 5
+# Waveform ticks kept per point before the final downsampling
+TICKS_PER_POINT = 4
+DESCRIPTORS_TTL_SECONDS = int(os.getenv("SYNTHESIS_CACHE_TTL", 7 * 24 * 3600))
+KEY_PREFIX = "audio_descriptors:"
+
+redis_client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+
+
+def _dbfs(level):
+    return round(float(20 * np.log10(level)), 2) if level > 0 else None
+
+
+def waveform(samples, points=WAVEFORM_POINTS):
+    """Peak |sample| across channels for each of up to points equal buckets."""
+    frames = samples.shape[0]
+    if frames == 0:
+        return []
+    magnitude = np.abs(samples).max(axis=1)
+    edges = np.linspace(0, frames, min(points, frames) + 1).astype(np.int64)
+    peaks = np.maximum.reduceat(magnitude, edges[:-1])
+    return [round(float(p), 3) for p in np.minimum(peaks, 1.0)]
+
+
+class Accumulator:
+    """
+    Descriptors of samples fed in consecutive (frames, channels) blocks.
+    expected_frames sizes the waveform ticks; an estimate is enough.
+    """
+
+    def __init__(self, sample_rate, channels, expected_frames=None):
+        self.sample_rate, self.channels = sample_rate, channels
+        self.frames, self.peak, self.sum_squares = 0, 0.0, 0.0
+        self.step_frames = audio_effects.loudness_step_frames(sample_rate)
+        # Unknown length: 10 ms ticks, fine enough for short clips
+        self.tick_frames = max(1, expected_frames // (WAVEFORM_POINTS * TICKS_PER_POINT)
+                               if expected_frames else sample_rate // 100)
+        self.steps, self.ticks = [], []
+        # Frames short of a whole loudness step, magnitudes short of a tick
+        self.step_rest = np.zeros((0, channels), dtype=np.float32)
+        self.tick_rest = np.zeros(0, dtype=np.float32)
+
+    def feed(self, samples):
+        if not samples.size:
+            return self
+        self.frames += samples.shape[0]
+        magnitude = np.abs(samples).max(axis=1)
+        self.peak = max(self.peak, float(magnitude.max()))
+        self.sum_squares += float(np.square(samples, dtype=np.float64).sum())
+
+        pending = np.concatenate([self.step_rest, samples])
+        whole = len(pending) // self.step_frames * self.step_frames
+        if whole:
+            self.steps.append(audio_effects.step_energies(pending[:whole], self.sample_rate))
+        self.step_rest = pending[whole:]
+
+        pending = np.concatenate([self.tick_rest, magnitude])
+        whole = len(pending) // self.tick_frames * self.tick_frames
+        if whole:
+            self.ticks.append(pending[:whole].reshape(-1, self.tick_frames).max(axis=1))
+        self.tick_rest = pending[whole:]
+        return self
+
+    def result(self):
+        ticks = self.ticks + ([self.tick_rest.max(keepdims=True)] if self.tick_rest.size else [])
+        ticks = np.concatenate(ticks) if ticks else np.zeros(0, dtype=np.float32)
+        steps = np.concatenate(self.steps) if self.steps else np.zeros(0)
+        loudness = audio_effects.gated_loudness(
+            audio_effects.blocks_from_steps(steps, self.sample_rate))
+        samples = self.frames * self.channels
+        rms = np.sqrt(self.sum_squares / samples) if samples else 0.0
+        return {
+            "duration_seconds": round(self.frames / self.sample_rate, 3),
+            "sample_rate": self.sample_rate,
+            "channels": self.channels,
+            "peak_dbfs": _dbfs(self.peak),
+            "rms_dbfs": _dbfs(rms),
+            "loudness_lufs": round(loudness, 2) if np.isfinite(loudness) else None,
+            "waveform": waveform(ticks.reshape(-1, 1)),
+        }
+
+
+def describe(samples, sample_rate):
+    """Descriptors of float (frames, channels) samples in [-1, 1]."""
+    return Accumulator(sample_rate, samples.shape[1], samples.shape[0]).feed(samples).result()
+
+
+def describe_segment(audio):
+    """Descriptors of a decoded pydub AudioSegment."""
+    return describe(*audio_effects.segment_samples(audio))
+
+
+def describe_file(path):
+    """
+    Describe path by streaming its decoded PCM through an Accumulator, a
+    block at a time; picklable for worker_pool.run_cpu.
+    """
+    sample_rate, channels, duration = transcode.probe(path)
+    expected = int(duration * sample_rate) if duration else None
+    accumulator = Accumulator(sample_rate, channels, expected)
+    for block in transcode.iter_pcm(path, channels, DESCRIBE_BLOCK_SECONDS * sample_rate):
+        pcm = np.frombuffer(block, dtype="<i2").reshape(-1, channels)
+        accumulator.feed(pcm.astype(np.float32) / 32768.0)
+    return accumulator.result()
+
+
+def process_and_describe(source, dest, effects, audio_format="mp3"):
+    """audio_effects.process_file, also describing the processed samples."""
+    samples, sample_rate = audio_effects.load(source)
+    processed = audio_effects.apply_effects(samples, sample_rate, effects, copy=False)
+    audio_effects.save(processed, sample_rate, dest, audio_format)
+    return describe(processed, sample_rate)
+
+
+def remember(key, descriptors):
+    try:
+        redis_client.set(KEY_PREFIX + key, json.dumps(descriptors), ex=DESCRIPTORS_TTL_SECONDS)
+    except redis.RedisError:
+        logging.warning("Could not cache audio descriptors for %s", key)
+
+
+def recall(key):
+    """Descriptors remembered for a synthesis cache key, or None."""
+    try:
+        raw = redis_client.get(KEY_PREFIX + key)
+    except redis.RedisError:
+        return None
+    return json.loads(raw) if raw is not None else None
@@ -0,0 +1,94 @@
+"""
+Per-item batch state kept incrementally in Redis. Every change to an item
+gets the batch's next sequence number, so a client holding a cursor fetches
+only what changed since, a page at a time, whatever the batch size.
+
+    batch_progress:{id}:items   hash  index -> item JSON
+    batch_progress:{id}:log     zset  index scored by its latest sequence
+    batch_progress:{id}:counts  hash  total, SUCCESS, FAILURE, seq
+"""
+import json, os
+import redis
+
+PAGE_SIZE = 100
+# Item text is echoed back only this far; the full text is in the task metadata
+TEXT_PREVIEW_CHARS = 200
+
+redis_client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+
+# Merges the new fields into the item, stamps it with the next sequence
+# number and counts it once when it first reaches a terminal state.
+# KEYS: items, log, counts  ARGV: index, item JSON (without seq), status, ttl
+_UPDATE = redis_client.register_script("""
+local previous = redis.call('HGET', KEYS[1], ARGV[1])
+local item = {}
+local was_terminal = false
+if previous then
+  item = cjson.decode(previous)
+  was_terminal = item['status'] == 'SUCCESS' or item['status'] == 'FAILURE'
+end
+for field, value in pairs(cjson.decode(ARGV[2])) do item[field] = value end
+local seq = redis.call('HINCRBY', KEYS[3], 'seq', 1)
+item['seq'] = seq
+local encoded = cjson.encode(item)
+redis.call('HSET', KEYS[1], ARGV[1], encoded)
+redis.call('ZADD', KEYS[2], seq, ARGV[1])
+if not was_terminal and (ARGV[3] == 'SUCCESS' or ARGV[3] == 'FAILURE') then
+  redis.call('HINCRBY', KEYS[3], ARGV[3], 1)
+end
+for i = 1, 3 do redis.call('EXPIRE', KEYS[i], ARGV[4]) end
+return encoded
+""")
+
+
+def _keys(batch_id):
+    prefix = f"batch_progress:{batch_id}"
+    return [f"{prefix}:items", f"{prefix}:log", f"{prefix}:counts"]
+
+
+def init(batch_id, total, ttl):
+    counts = _keys(batch_id)[2]
+    pipe = redis_client.pipeline()
+    pipe.hset(counts, mapping={"total": total, "SUCCESS": 0, "FAILURE": 0, "seq": 0})
+    pipe.expire(counts, ttl)
+    pipe.execute()
+
+
+def update(batch_id, index, status, ttl, text=None, **fields):
+    """Record an item's new status; returns the stored item including its seq."""
+    item = dict(fields, index=index, status=status)
+    if text is not None:
+        item["text"] = text[:TEXT_PREVIEW_CHARS]
+    encoded = _UPDATE(keys=_keys(batch_id), args=[index, json.dumps(item), status, ttl])
+    return json.loads(encoded)
+
+
+def counts(batch_id):
+    """total/completed/failed/pending and the latest sequence; None if unknown."""
+    raw = redis_client.hgetall(_keys(batch_id)[2])
+    if not raw:
+        return None
+    values = {k.decode(): int(v) for k, v in raw.items()}
+    completed, failed = values.get("SUCCESS", 0), values.get("FAILURE", 0)
+    return {
+        "total": values["total"],
+        "completed": completed,
+        "failed": failed,
+        "pending": values["total"] - completed - failed,
+        "seq": values.get("seq", 0),
+    }
+
+
+def changes(batch_id, cursor=0, limit=PAGE_SIZE):
+    """Items changed after cursor, oldest change first: (items, next_cursor, has_more)."""
+    items_key, log_key, _ = _keys(batch_id)
+    limit = max(1, min(int(limit), PAGE_SIZE))
+    entries = redis_client.zrangebyscore(log_key, f"({int(cursor)}", "+inf",
+                                         start=0, num=limit + 1, withscores=True)
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    if not entries:
+        return [], int(cursor), False
+    raw_items = redis_client.hmget(items_key, [index for index, _ in entries])
+    items = [json.loads(raw) for raw in raw_items if raw is not None]
+    return items, int(entries[-1][1]), has_more
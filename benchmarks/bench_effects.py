@@ -0,0 +1,96 @@
+"""
+Compare the NumPy effects engine with the previous pydub effect chain.
+
+Both run on the same in-memory multi-minute signal (mono by default, as
+the TTS provider returns), so only the effect
+processing is measured (decode and encode are identical single passes for
+both). Reports wall time and peak traced memory per run as JSON.
+
+    python benchmarks/bench_effects.py --minutes 5 --repeat 3
+"""
+import argparse, json, os, sys, time, tracemalloc
+import numpy as np
+from pydub import AudioSegment
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import audio_effects
+
+
+def synthetic_speech(minutes, channels=1, sample_rate=44100):
+    """Harmonic tones under a syllable-rate envelope, roughly speech-shaped."""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(minutes * 60 * sample_rate)) / sample_rate
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.3 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) ** 2
+    signal = 0.2 * voiced * envelope + 0.01 * rng.standard_normal(len(t))
+    frames = np.stack([signal * (1 - 0.1 * c) for c in range(channels)], axis=1)
+    return frames.astype(np.float32), sample_rate
+
+
+def legacy_chain(audio, effects):
+    """The pydub chain advanced_audio_processing used before the NumPy engine."""
+    if 'volume' in effects:
+        audio = audio + effects['volume']
+    if 'fade_in' in effects:
+        audio = audio.fade_in(effects['fade_in'])
+    if 'fade_out' in effects:
+        audio = audio.fade_out(effects['fade_out'])
+    if 'speed' in effects:
+        audio = audio._spawn(audio.raw_data, overrides={
+            "frame_rate": int(audio.frame_rate * effects['speed'])
+        }).set_frame_rate(audio.frame_rate)
+    if effects.get('normalize', False):
+        audio = audio.normalize()
+    return audio
+
+
+def measure(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    # Memory is traced in a separate run; tracemalloc skews the timings
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"wall_seconds_min": min(timings),
+            "wall_seconds_mean": sum(timings) / len(timings),
+            "peak_traced_bytes": peak}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--minutes", type=float, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--channels", type=int, default=1)
+    args = parser.parse_args()
+
+    samples, sample_rate = synthetic_speech(args.minutes, args.channels)
+    pcm = (samples * 32767).astype("<i2")
+    segment = AudioSegment(pcm.tobytes(), frame_rate=sample_rate, sample_width=2,
+                           channels=args.channels)
+
+    scenarios = {
+        "gain_fades_normalize": {'volume': 3.0, 'fade_in': 500, 'fade_out': 1500, 'normalize': True},
+        "full_chain_with_speed": {'volume': 3.0, 'fade_in': 500, 'fade_out': 1500,
+                                  'normalize': True, 'speed': 1.25},
+    }
+    results = []
+    for name, effects in scenarios.items():
+        results.append({
+            "scenario": name,
+            "effects": effects,
+            "pydub": measure(lambda: legacy_chain(segment, effects), args.repeat),
+            "numpy": measure(lambda: audio_effects.apply_effects(samples, sample_rate, effects),
+                             args.repeat),
+        })
+    print(json.dumps({"minutes": args.minutes, "sample_rate": sample_rate,
+                      "channels": args.channels, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
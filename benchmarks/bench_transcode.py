@@ -0,0 +1,90 @@
+"""
+Compare the output-encoding paths of async_synthesize_and_save.
+
+  legacy  - AudioSegment.from_file + audio.export (full PCM decode in Python)
+  direct  - provider bytes written unchanged (mp3 -> mp3 fast path)
+  ffmpeg  - provider bytes piped through ffmpeg (mp3 -> other formats)
+
+Each path runs in a fresh interpreter so peak RSS is not polluted by the
+others. CPU time includes child processes (ffmpeg). Results are printed as JSON.
+
+    python benchmarks/bench_transcode.py sample.mp3 --format wav --repeat 5
+"""
+import argparse, io, json, os, resource, subprocess, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def run_path(path, source, audio_format, repeat):
+    from pydub import AudioSegment
+    import transcode
+
+    with open(source, "rb") as f:
+        audio_bytes = f.read()
+    out_dir = tempfile.mkdtemp(prefix="bench_transcode_")
+    cpu_before = _cpu_seconds()
+    wall = time.perf_counter()
+    for i in range(repeat):
+        dest = os.path.join(out_dir, f"out_{i}.{audio_format}")
+        if path == "legacy":
+            audio = AudioSegment.from_file(io.BytesIO(audio_bytes), format="mp3")
+            audio.export(dest, format=audio_format)
+        elif path == "direct":
+            transcode.write_direct([audio_bytes], dest)
+        else:
+            transcode.pipe_through_ffmpeg([audio_bytes], dest, audio_format)
+        os.remove(dest)
+    wall = time.perf_counter() - wall
+    cpu = _cpu_seconds() - cpu_before
+    os.rmdir(out_dir)
+
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return {
+        "path": path,
+        "format": audio_format,
+        "repeat": repeat,
+        "wall_seconds_per_run": wall / repeat,
+        "cpu_seconds_per_run": cpu / repeat,
+        "peak_rss_bytes": own.ru_maxrss * scale,
+        "peak_child_rss_bytes": children.ru_maxrss * scale,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("source", help="mp3 file as returned by the TTS provider")
+    parser.add_argument("--format", default="wav", help="target format for legacy/ffmpeg paths")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--paths", default="legacy,direct,ffmpeg")
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        fmt = "mp3" if args.run == "direct" else args.format
+        print(json.dumps(run_path(args.run, args.source, fmt, args.repeat)))
+        return
+
+    results = []
+    for path in args.paths.split(","):
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), args.source,
+             "--format", args.format, "--repeat", str(args.repeat), "--run", path],
+            check=True, capture_output=True, text=True
+        )
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    print(json.dumps({"source": args.source,
+                      "source_bytes": os.path.getsize(args.source),
+                      "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
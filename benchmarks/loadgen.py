@@ -0,0 +1,309 @@
+"""
+Load generator for the web app. Drives /, /batch, /task_status,
+/batch_status, /dashboard and /analytics from concurrent virtual users and
+writes a JSON report (throughput, p50/p95/p99 per operation, and per-stage
+breakdowns from task metadata) for regression tracking.
+
+Real workers, against a running server:
+
+    python benchmarks/mock_elevenlabs.py --port 8089 &
+    ELEVENLABS_API_URL=http://127.0.0.1:8089 celery -A app.celery_app worker &
+    ELEVENLABS_API_URL=http://127.0.0.1:8089 python app.py &
+    python benchmarks/loadgen.py --target http://127.0.0.1:5001 --users 20 --duration 60
+
+Eager tasks, in-process (starts its own mock unless --mock-url is given):
+
+    python benchmarks/loadgen.py --in-process --users 4 --duration 30
+
+Every text carries a unique reference number, so each request is a fresh
+synthesis; --cache-hit-ratio 0.3 sends 30% of texts without one, which
+repeat and exercise the synthesis cache.
+"""
+import argparse, json, os, random, re, statistics, sys, threading, time, uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_TASK_ID_RE = re.compile(r"ID: ([0-9a-fA-F-]{36})")
+SAMPLE_SENTENCES = [
+    "Your appointment is confirmed for tomorrow at ten in the morning.",
+    "Press one to speak with a representative, or two to hear your balance.",
+    "The quarterly report shows steady growth across all regions.",
+    "Thank you for calling. Please stay on the line.",
+    "Your package has been shipped and will arrive within three business days.",
+]
+
+
+class HttpTarget:
+    """A running server reached over HTTP, one keep-alive session per user."""
+
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+
+    def get(self, path):
+        r = self.session.get(self.base_url + path, timeout=120)
+        return r.status_code, r.text
+
+    def post(self, path, data):
+        r = self.session.post(self.base_url + path, data=data, timeout=120)
+        return r.status_code, r.text
+
+
+class InProcessTarget:
+    """The Flask app driven through its test client; tasks run eagerly."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def get(self, path):
+        r = self.client.get(path)
+        return r.status_code, r.get_data(as_text=True)
+
+    def post(self, path, data):
+        r = self.client.post(path, data=data, follow_redirects=True)
+        return r.status_code, r.get_data(as_text=True)
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+        self.stages = {}
+
+    def record(self, op, seconds, ok=True):
+        with self.lock:
+            self.samples.setdefault(op, []).append(seconds)
+            if not ok:
+                self.errors[op] = self.errors.get(op, 0) + 1
+
+    def stage(self, name, seconds):
+        with self.lock:
+            self.stages.setdefault(name, []).append(seconds)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "mean": statistics.fmean(values) if values else None,
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": max(values) if values else None,
+    }
+
+
+def timed(recorder, op, fn, *args):
+    started = time.perf_counter()
+    status, body = fn(*args)
+    recorder.record(op, time.perf_counter() - started, ok=200 <= status < 400)
+    return status, body
+
+
+def collect_stages(target, recorder, task_id):
+    """
+    Fold every *_seconds value of a task's metadata, including those nested
+    under a *_seconds mapping such as stage_seconds, into the stage breakdown.
+    """
+    status, body = target.get(f"/metrics/{task_id}")
+    if status != 200:
+        return
+    metadata = json.loads(body)
+
+    def walk(prefix, value):
+        if isinstance(value, dict):
+            for key, inner in value.items():
+                walk(f"{prefix}{key}.", inner)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) \
+                and any(part.endswith("seconds") for part in prefix.split(".")):
+            recorder.stage(prefix.rstrip("."), float(value))
+
+    walk("", metadata)
+
+
+def wait_for(target, recorder, op, path, deadline, interval):
+    while time.monotonic() < deadline:
+        status, body = timed(recorder, op, target.get, path)
+        if status == 200:
+            state = json.loads(body).get("status")
+            if state in ("SUCCESS", "FAILURE"):
+                return state
+        time.sleep(interval)
+    return "TIMEOUT"
+
+
+def make_text(args, sentences=1):
+    """Sample sentences, unique unless picked as a repeat per --cache-hit-ratio."""
+    text = " ".join(random.sample(SAMPLE_SENTENCES, k=sentences))
+    if random.random() < args.cache_hit_ratio:
+        return text
+    return f"{text} Reference {uuid.uuid4().hex[:12]}."
+
+
+def synthesize(target, recorder, args):
+    text = make_text(args, random.randint(1, 3))
+    started = time.perf_counter()
+    status, body = timed(recorder, "submit /", target.post, "/", {
+        "lyrics": text, "voice": args.voice, "emotionLevel": "neutral",
+        "pitch": "1.0", "rate": "1.0", "audio_format": args.audio_format,
+    })
+    match = _TASK_ID_RE.search(body)
+    if not match:
+        recorder.record("synthesis end-to-end", time.perf_counter() - started, ok=False)
+        return
+    task_id = match.group(1)
+    state = wait_for(target, recorder, "GET /task_status", f"/task_status/{task_id}",
+                     time.monotonic() + args.task_timeout, args.poll_interval)
+    recorder.record("synthesis end-to-end", time.perf_counter() - started, ok=state == "SUCCESS")
+    if state == "SUCCESS":
+        collect_stages(target, recorder, task_id)
+
+
+def batch(target, recorder, args):
+    texts = [make_text(args) for _ in range(args.batch_size)]
+    started = time.perf_counter()
+    status, body = timed(recorder, "submit /batch", target.post, "/batch", {
+        "batch_text": "\n".join(texts), "delimiter": "line", "voice": args.voice,
+        "emotionLevel": "neutral", "pitch": "1.0", "rate": "1.0",
+        "audio_format": args.audio_format,
+    })
+    match = _TASK_ID_RE.search(body)
+    if not match:
+        recorder.record("batch end-to-end", time.perf_counter() - started, ok=False)
+        return
+    state = wait_for(target, recorder, "GET /batch_status", f"/batch_status/{match.group(1)}",
+                     time.monotonic() + args.task_timeout * args.batch_size, args.poll_interval)
+    recorder.record("batch end-to-end", time.perf_counter() - started, ok=state == "SUCCESS")
+
+
+def dashboard(target, recorder, args):
+    timed(recorder, "GET /dashboard", target.get, "/dashboard")
+
+
+def analytics(target, recorder, args):
+    timed(recorder, "GET /analytics", target.get, "/analytics")
+
+
+ACTIONS = {"synthesize": synthesize, "batch": batch,
+           "dashboard": dashboard, "analytics": analytics}
+
+
+def user_loop(make_target, recorder, args, stop_at, counter):
+    target = make_target()
+    target.post("/login", {"username": args.username, "password": args.password})
+    names = list(args.mix)
+    weights = [args.mix[n] for n in names]
+    while time.monotonic() < stop_at:
+        action = random.choices(names, weights)[0]
+        try:
+            ACTIONS[action](target, recorder, args)
+        except Exception as e:
+            recorder.record(f"{action} exception", 0.0, ok=False)
+            print(f"{action} failed: {e}", file=sys.stderr)
+        with counter["lock"]:
+            counter["iterations"] += 1
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ACTIONS:
+            raise argparse.ArgumentTypeError(f"unknown action {name!r}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def parse_ratio(value):
+    ratio = float(value)
+    if not 0.0 <= ratio <= 1.0:
+        raise argparse.ArgumentTypeError("must be between 0 and 1")
+    return ratio
+
+
+def start_mock(args):
+    from benchmarks import mock_elevenlabs
+    mock_args = mock_elevenlabs.parse_args(["--port", "0",
+                                            "--latency-median", str(args.mock_latency)])
+    server = mock_elevenlabs.make_server(mock_args)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--target", help="base URL of a running server (real workers)")
+    mode.add_argument("--in-process", action="store_true", help="test client + eager tasks")
+    parser.add_argument("--mock-url", help="ElevenLabs stand-in for --in-process runs")
+    parser.add_argument("--mock-latency", type=float, default=0.3)
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--mix", type=parse_mix,
+                        default=parse_mix("synthesize=6,batch=1,dashboard=2,analytics=1"))
+    parser.add_argument("--batch-size", type=int, default=5)
+    parser.add_argument("--cache-hit-ratio", type=parse_ratio, default=0.0,
+                        help="share of texts drawn from a small repeating set (0..1)")
+    parser.add_argument("--voice", default="mock-voice-0")
+    parser.add_argument("--audio-format", default="mp3")
+    parser.add_argument("--poll-interval", type=float, default=0.1)
+    parser.add_argument("--task-timeout", type=float, default=60)
+    parser.add_argument("--username", default="demo")
+    parser.add_argument("--password", default="demo")
+    parser.add_argument("--label", default="", help="free-form tag stored in the report")
+    parser.add_argument("--output", help="write the JSON report here as well as stdout")
+    args = parser.parse_args(argv)
+
+    if args.in_process:
+        os.environ["CELERY_TASK_ALWAYS_EAGER"] = "1"
+        os.environ.setdefault("ELEVENLABS_API_URL", args.mock_url or start_mock(args))
+        import app as webapp
+        make_target = lambda: InProcessTarget(webapp.app)
+        mode_name = "eager"
+    else:
+        make_target = lambda: HttpTarget(args.target)
+        mode_name = "workers"
+
+    recorder = Recorder()
+    counter = {"iterations": 0, "lock": threading.Lock()}
+    started = time.monotonic()
+    stop_at = started + args.duration
+    threads = [threading.Thread(target=user_loop,
+                                args=(make_target, recorder, args, stop_at, counter))
+               for _ in range(args.users)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    report = {
+        "label": args.label,
+        "mode": mode_name,
+        "users": args.users,
+        "cache_hit_ratio": args.cache_hit_ratio,
+        "duration_seconds": elapsed,
+        "iterations": counter["iterations"],
+        "throughput": {op: len(v) / elapsed for op, v in recorder.samples.items()},
+        "latency": {op: summarize(v) for op, v in recorder.samples.items()},
+        "errors": recorder.errors,
+        "stages": {name: summarize(v) for name, v in recorder.stages.items()},
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
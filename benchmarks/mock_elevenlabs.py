@@ -0,0 +1,226 @@
+"""
+Local stand-in for the ElevenLabs endpoints the app calls:
+
+  GET  /v1/voices
+  POST /v1/text-to-speech/{voice_id}
+  POST /v1/text-to-speech/{voice_id}/stream
+
+Responses are real, decodable mp3 (silent MPEG-1 Layer III frames, or a file
+given with --mp3-file) sized to the text, so the decode/encode stages do real
+work. Latency, error rate and 429 throttling are configurable:
+
+    python benchmarks/mock_elevenlabs.py --port 8089 --latency-median 0.8 \\
+        --latency-sigma 0.4 --error-rate 0.01 --rate-limit 10 --max-concurrency 5
+    ELEVENLABS_API_URL=http://127.0.0.1:8089 python app.py
+"""
+import argparse, json, math, random, re, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, mono, no CRC. Zeroed side info and
+# main data decode to 1152 samples of silence per frame.
+_FRAME_HEADER = bytes([0xFF, 0xFB, 0x90, 0xC0])
+_FRAME_BYTES = 144 * 128000 // 44100
+SILENT_FRAME = _FRAME_HEADER + bytes(_FRAME_BYTES - len(_FRAME_HEADER))
+FRAME_SECONDS = 1152 / 44100
+
+_TTS_RE = re.compile(r"^/v1/text-to-speech/([^/]+)(/stream)?/?$")
+
+VOICES = [
+    {"voice_id": f"mock-voice-{i}", "name": name, "category": "premade"}
+    for i, name in enumerate(["Rachel", "Domi", "Bella", "Antoni", "Josh", "Arnold"])
+]
+
+
+class TokenBucket:
+    """Requests-per-second limiter; rate <= 0 disables it."""
+
+    def __init__(self, rate, burst):
+        self.rate, self.capacity = rate, max(burst, 1)
+        self.tokens, self.updated = float(self.capacity), time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        """Returns 0 when admitted, otherwise seconds until a token is available."""
+        if self.rate <= 0:
+            return 0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+
+class MockState:
+    def __init__(self, args):
+        self.args = args
+        self.bucket = TokenBucket(args.rate_limit, args.burst)
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        self.counters = {"requests": 0, "ok": 0, "errors": 0, "throttled": 0}
+        self.payload = None
+        if args.mp3_file:
+            with open(args.mp3_file, "rb") as f:
+                self.payload = f.read()
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def latency(self, chars):
+        base = random.lognormvariate(math.log(self.args.latency_median), self.args.latency_sigma) \
+            if self.args.latency_sigma > 0 else self.args.latency_median
+        return base + chars * self.args.latency_per_char
+
+    def audio(self, text):
+        if self.payload is not None:
+            return self.payload
+        seconds = max(0.5, len(text) / self.args.chars_per_second)
+        return SILENT_FRAME * max(1, int(seconds / FRAME_SECONDS))
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, fmt, *args):
+        if self.state.args.verbose:
+            super().log_message(fmt, *args)
+
+    def _json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.split("?")[0].rstrip("/") == "/v1/voices":
+            self._json(200, {"voices": VOICES})
+        elif self.path == "/__stats":
+            self._json(200, dict(self.state.counters, in_flight=self.state.in_flight))
+        else:
+            self._json(404, {"detail": "not found"})
+
+    def do_POST(self):
+        state = self.state
+        match = _TTS_RE.match(self.path.split("?")[0])
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if not match:
+            self._json(404, {"detail": "not found"})
+            return
+        state.count("requests")
+        try:
+            text = json.loads(body or b"{}").get("text", "")
+        except ValueError:
+            self._json(400, {"detail": "invalid json"})
+            return
+
+        wait = state.bucket.take()
+        with state.lock:
+            over_capacity = state.args.max_concurrency and state.in_flight >= state.args.max_concurrency
+            if not wait and not over_capacity:
+                state.in_flight += 1
+        if wait or over_capacity:
+            state.count("throttled")
+            retry_after = max(1, math.ceil(wait or state.args.latency_median))
+            self._json(429, {"detail": {"status": "too_many_concurrent_requests"}},
+                       {"Retry-After": str(retry_after)})
+            return
+
+        try:
+            latency = state.latency(len(text))
+            if random.random() < state.args.error_rate:
+                time.sleep(latency * random.random())
+                state.count("errors")
+                self._json(500, {"detail": "mock internal error"})
+                return
+            audio = state.audio(text)
+            if match.group(2):
+                self._stream(audio, latency)
+            else:
+                time.sleep(latency)
+                self.send_response(200)
+                self.send_header("Content-Type", "audio/mpeg")
+                self.send_header("Content-Length", str(len(audio)))
+                self.end_headers()
+                self.wfile.write(audio)
+            state.count("ok")
+        finally:
+            with state.lock:
+                state.in_flight -= 1
+
+    def _stream(self, audio, latency):
+        """Chunked response: first chunk after the TTFB share, the rest spread out."""
+        args = self.state.args
+        chunks = [audio[i:i + args.stream_chunk_bytes]
+                  for i in range(0, len(audio), args.stream_chunk_bytes)]
+        ttfb = latency * args.stream_ttfb_fraction
+        gap = (latency - ttfb) / max(1, len(chunks) - 1)
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(ttfb)
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(gap)
+            self.wfile.write(f"{len(chunk):X}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local ElevenLabs stand-in for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-median", type=float, default=0.8,
+                        help="median seconds per synthesis request")
+    parser.add_argument("--latency-sigma", type=float, default=0.35,
+                        help="lognormal sigma; 0 for a fixed latency")
+    parser.add_argument("--latency-per-char", type=float, default=0.0,
+                        help="extra seconds per input character")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of requests answered with HTTP 500")
+    parser.add_argument("--rate-limit", type=float, default=0.0,
+                        help="requests per second before 429; 0 disables")
+    parser.add_argument("--burst", type=int, default=5)
+    parser.add_argument("--max-concurrency", type=int, default=0,
+                        help="concurrent requests before 429; 0 disables")
+    parser.add_argument("--chars-per-second", type=float, default=15.0,
+                        help="speech rate used to size the mp3 payload")
+    parser.add_argument("--mp3-file", help="serve this mp3 instead of generated silence")
+    parser.add_argument("--stream-chunk-bytes", type=int, default=4096)
+    parser.add_argument("--stream-ttfb-fraction", type=float, default=0.2)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--verbose", action="store_true")
+    return parser.parse_args(argv)
+
+
+def make_server(args):
+    Handler.state = MockState(args)
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.seed is not None:
+        random.seed(args.seed)
+    server = make_server(args)
+    print(f"Mock ElevenLabs listening on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
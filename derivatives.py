@@ -0,0 +1,133 @@
+import hashlib, json, logging, os, shutil, time
+import redis
+import storage
+
+# Post-processed audio lives next to the outputs so serve_audio can deliver it,
+# named <source file>.<hash of source + effects>.<ext>
+DERIVED_DIR = os.path.join(storage.OUTPUT_DIR, "derived")
+DERIVED_MAX_BYTES = int(os.getenv("DERIVED_MAX_BYTES", 1024 ** 3))
+DERIVED_MIN_FREE_BYTES = int(os.getenv("DERIVED_MIN_FREE_BYTES", 512 * 1024 ** 2))
+# How long a claimed job blocks identical requests if its worker never finishes
+JOB_LEASE_SECONDS = 600
+os.makedirs(DERIVED_DIR, exist_ok=True)
+
+redis_client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+
+# Effect values that leave the audio unchanged are dropped before hashing
+_NEUTRAL = {"volume": 0.0, "fade_in": 0, "fade_out": 0, "speed": 1.0, "normalize": False}
+
+
+def normalize_effects(effects):
+    """Canonical form of an effects dict: no neutral values, rounded numbers."""
+    normalized = {}
+    for name, value in effects.items():
+        if isinstance(value, float):
+            value = round(value, 4)
+        if name in _NEUTRAL and value == _NEUTRAL[name]:
+            continue
+        normalized[name] = value
+    return normalized
+
+
+def derivative_key(source, effects):
+    """Hash of the source file's identity and the normalized effect chain."""
+    st = os.stat(source)
+    # The file name, not its path: output names are unique, and moving a
+    # source between storage shards must not orphan its derivatives
+    identity = {
+        "source": os.path.basename(source),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "effects": normalize_effects(effects),
+    }
+    canonical = json.dumps(identity, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def derivative_path(source, key, ext="mp3"):
+    return os.path.join(DERIVED_DIR, f"{os.path.basename(source)}.{key[:32]}.{ext}")
+
+
+def _job_key(key):
+    return f"derivative_job:{key}"
+
+
+def claim_job(key, task_id):
+    """
+    Register task_id as the job producing key. Returns the task id that owns
+    the job: task_id itself if this caller should enqueue, otherwise the id of
+    the identical job already in flight.
+    """
+    if redis_client.set(_job_key(key), task_id, nx=True, ex=JOB_LEASE_SECONDS):
+        return task_id
+    owner = redis_client.get(_job_key(key))
+    if owner is None:
+        # The other job finished between our SET and GET; try again once
+        if redis_client.set(_job_key(key), task_id, nx=True, ex=JOB_LEASE_SECONDS):
+            return task_id
+        owner = redis_client.get(_job_key(key)) or task_id.encode()
+    return owner.decode() if isinstance(owner, bytes) else owner
+
+
+def release_job(key):
+    redis_client.delete(_job_key(key))
+
+
+def _source_of(name):
+    """Original output file a derivative was made from, recovered from its name."""
+    return storage.locate_audio(name.rsplit(".", 2)[0])
+
+
+def _remove(path):
+    """Delete path; False if something else (a concurrent evict) already did."""
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def evict(max_bytes=None, min_free_bytes=None):
+    """
+    Drop derivatives whose source is gone (storage_gc runs this right after
+    storage eviction), then least recently used ones
+    while over max_bytes or while the disk has less than min_free_bytes free.
+    Files that vanish mid-scan are skipped, so overlapping runs are harmless.
+    """
+    max_bytes = DERIVED_MAX_BYTES if max_bytes is None else max_bytes
+    min_free_bytes = DERIVED_MIN_FREE_BYTES if min_free_bytes is None else min_free_bytes
+    entries, total, evicted = [], 0, 0
+    for entry in os.scandir(DERIVED_DIR):
+        if not entry.is_file() or entry.name.endswith(".part"):
+            continue
+        if _source_of(entry.name) is None:
+            evicted += _remove(entry.path)
+            continue
+        try:
+            st = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_atime, st.st_size, entry.path))
+        total += st.st_size
+
+    entries.sort()
+    free = shutil.disk_usage(DERIVED_DIR).free
+    for _, size, path in entries:
+        if total <= max_bytes and free >= min_free_bytes:
+            break
+        total -= size
+        if _remove(path):
+            free += size
+            evicted += 1
+
+    if evicted:
+        logging.info("Evicted %d derived audio files, %d bytes remain", evicted, total)
+    return evicted
+
+
+def touch(path):
+    """Record an access for LRU eviction without changing the mtime."""
+    try:
+        os.utime(path, (time.time(), os.stat(path).st_mtime))
+    except FileNotFoundError:
+        pass
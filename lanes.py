@@ -0,0 +1,151 @@
+"""
+Two scheduling lanes. Interactive synthesis goes straight onto its own,
+higher-priority Celery queue. Batch items wait here in per-user lists and
+are released onto the batch queue round-robin across users, within a lane
+capacity and a per-user cap, so one large batch cannot starve others.
+
+Released items hold a lease rather than a counter: every attempt of the item
+renews it and its completion hook drops it, so an item whose task was lost
+or whose worker died gives its slot back once the lease runs out.
+
+process_batch and the per-item completion hooks run on the batch queue too;
+only the small batch_lane_pump task shares the interactive one.
+
+Run dedicated workers per lane to hold the interactive SLO. Workers consume
+their queues in the order given to -Q, so list interactive first:
+
+    celery -A app.celery_app worker -Q interactive
+    celery -A app.celery_app worker -Q interactive,batch
+"""
+import os, time
+import redis
+
+INTERACTIVE_QUEUE = "interactive"
+BATCH_QUEUE = "batch"
+# Batch items queued or running at once across all users, and per user
+BATCH_LANE_CAPACITY = int(os.getenv("BATCH_LANE_CAPACITY", 32))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+# An item not renewed or finished within this long is presumed lost; it must
+# cover queueing, one attempt and the retry countdown before the next
+BATCH_ITEM_LEASE_SECONDS = int(os.getenv("BATCH_ITEM_LEASE_SECONDS", 900))
+
+ROTATION_KEY = "batch_lane:rotation"
+ACTIVE_KEY = "batch_lane:active"
+COUNTS_KEY = "batch_lane:counts"
+USER_PREFIX = "batch_lane:user:"
+# Leases of released items: "user|batch|index" lane-wide, "batch|index" per user,
+# each scored by expiry in ms
+LEASES_KEY = "batch_lane:leases"
+USER_LEASES_PREFIX = "batch_lane:leases:"
+
+redis_client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+
+# Next item in round-robin order from a user below the per-user cap, leased
+# until now + lease ms, or nil when the lane is full or nobody eligible is
+# waiting. Expired leases are dropped first, which frees their slots.
+# KEYS: rotation list, active set, counts hash, leases zset
+# ARGV: capacity, user cap, pending prefix, user leases prefix, lease ms
+_NEXT_ITEM = redis_client.register_script("""
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local expires = now + tonumber(ARGV[5])
+redis.call('ZREMRANGEBYSCORE', KEYS[4], '-inf', now)
+if redis.call('ZCARD', KEYS[4]) >= tonumber(ARGV[1]) then
+  return false
+end
+for i = 1, redis.call('LLEN', KEYS[1]) do
+  local user = redis.call('RPOPLPUSH', KEYS[1], KEYS[1])
+  local pending = ARGV[3] .. user
+  local leases = ARGV[4] .. user
+  redis.call('ZREMRANGEBYSCORE', leases, '-inf', now)
+  if redis.call('LLEN', pending) == 0 then
+    redis.call('LREM', KEYS[1], 0, user)
+    redis.call('SREM', KEYS[2], user)
+  elseif redis.call('ZCARD', leases) < tonumber(ARGV[2]) then
+    local item = redis.call('LPOP', pending)
+    redis.call('ZADD', KEYS[4], expires, user .. '|' .. item)
+    redis.call('ZADD', leases, expires, item)
+    redis.call('PEXPIRE', leases, tonumber(ARGV[5]))
+    redis.call('HINCRBY', KEYS[3], '_pending', -1)
+    if redis.call('LLEN', pending) == 0 then
+      redis.call('LREM', KEYS[1], 0, user)
+      redis.call('SREM', KEYS[2], user)
+    end
+    return {user, item}
+  end
+end
+return false
+""")
+
+# Extends a released item's leases; items already finished or expired stay gone.
+# KEYS: leases zset, user leases zset  ARGV: lane member, user member, lease ms
+_RENEW = redis_client.register_script("""
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local expires = now + tonumber(ARGV[3])
+local renewed = redis.call('ZADD', KEYS[1], 'XX', 'CH', expires, ARGV[1])
+if redis.call('ZADD', KEYS[2], 'XX', 'CH', expires, ARGV[2]) == 1 then
+  redis.call('PEXPIRE', KEYS[2], tonumber(ARGV[3]))
+end
+return renewed
+""")
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def enqueue_batch(user_id, batch_id, count):
+    """Add a batch's items to the user's pending list and put the user in rotation."""
+    user = str(user_id)
+    pipe = redis_client.pipeline()
+    pipe.rpush(USER_PREFIX + user, *[f"{batch_id}|{index}" for index in range(count)])
+    pipe.hincrby(COUNTS_KEY, "_pending", count)
+    pipe.sadd(ACTIVE_KEY, user)
+    _, _, added = pipe.execute()
+    if added:
+        redis_client.lpush(ROTATION_KEY, user)
+
+
+def next_items():
+    """Claim every item the lane can start now, as (user_id, batch_id, index)."""
+    while True:
+        claimed = _NEXT_ITEM(keys=[ROTATION_KEY, ACTIVE_KEY, COUNTS_KEY, LEASES_KEY],
+                             args=[BATCH_LANE_CAPACITY, BATCH_CONCURRENCY, USER_PREFIX,
+                                   USER_LEASES_PREFIX, BATCH_ITEM_LEASE_SECONDS * 1000])
+        if not claimed:
+            return
+        user, item = _decode(claimed[0]), _decode(claimed[1])
+        batch_id, _, index = item.rpartition("|")
+        yield user, batch_id, int(index)
+
+
+def renew(user_id, batch_id, index):
+    """Keep a released item's slot while it is still being worked on."""
+    item = f"{batch_id}|{index}"
+    return bool(_RENEW(keys=[LEASES_KEY, USER_LEASES_PREFIX + str(user_id)],
+                       args=[f"{user_id}|{item}", item, BATCH_ITEM_LEASE_SECONDS * 1000]))
+
+
+def item_finished(user_id, batch_id, index):
+    item = f"{batch_id}|{index}"
+    pipe = redis_client.pipeline()
+    pipe.zrem(LEASES_KEY, f"{user_id}|{item}")
+    pipe.zrem(USER_LEASES_PREFIX + str(user_id), item)
+    pipe.execute()
+
+
+def stats():
+    """Broker queue depth per lane, plus batch items held back for fair share."""
+    pipe = redis_client.pipeline()
+    pipe.llen(INTERACTIVE_QUEUE)
+    pipe.llen(BATCH_QUEUE)
+    pipe.zcount(LEASES_KEY, int(time.time() * 1000), "+inf")
+    pipe.hget(COUNTS_KEY, "_pending")
+    pipe.scard(ACTIVE_KEY)
+    interactive, batch, in_flight, pending, users = pipe.execute()
+    return {
+        "interactive": {"queued": interactive},
+        "batch": {"queued": batch, "in_flight": in_flight,
+                  "held": int(pending or 0), "users_waiting": users},
+    }
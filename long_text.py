@@ -0,0 +1,98 @@
+import io, os, re, time
+from pydub import AudioSegment
+import audio_descriptors
+
+# Texts longer than this are split and synthesized chunk by chunk
+LONG_TEXT_THRESHOLD = int(os.getenv("LONG_TEXT_THRESHOLD", 2500))
+LONG_TEXT_CHUNK_CHARS = int(os.getenv("LONG_TEXT_CHUNK_CHARS", 1000))
+LONG_TEXT_CONCURRENCY = int(os.getenv("LONG_TEXT_CONCURRENCY", 4))
+# Joins between chunks: a short pause plus a crossfade hides the seams
+LONG_TEXT_GAP_MS = int(os.getenv("LONG_TEXT_GAP_MS", 120))
+LONG_TEXT_CROSSFADE_MS = int(os.getenv("LONG_TEXT_CROSSFADE_MS", 20))
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+# Whitespace after terminal punctuation, which may be followed by up to two
+# closing quotes or brackets; those stay with their sentence
+_SENTENCE_RE = re.compile(r"(?:(?<=[.!?…])|(?<=[.!?…][\"')\]])|(?<=[.!?…][\"')\]]{2}))\s+")
+
+
+def _split_oversized(sentence, max_chars):
+    """Break a sentence with no usable boundary on whitespace, then hard-cut."""
+    pieces, current = [], ""
+    for word in sentence.split():
+        while len(word) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(word[:max_chars])
+            word = word[max_chars:]
+        if current and len(current) + 1 + len(word) > max_chars:
+            pieces.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_text(text, max_chars=None):
+    """Split text into chunks of at most max_chars, on paragraph and sentence boundaries."""
+    max_chars = max_chars or LONG_TEXT_CHUNK_CHARS
+    chunks = []
+    for paragraph in _PARAGRAPH_RE.split(text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        current = ""
+        for sentence in _SENTENCE_RE.split(paragraph):
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            if len(sentence) > max_chars:
+                if current:
+                    chunks.append(current)
+                    current = ""
+                chunks.extend(_split_oversized(sentence, max_chars))
+            elif current and len(current) + 1 + len(sentence) > max_chars:
+                chunks.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+        # Never merge across paragraphs so the natural pause is kept
+        if current:
+            chunks.append(current)
+    return chunks
+
+
+def stitch_segments(segments, gap_ms=None, crossfade_ms=None):
+    """Join AudioSegments in order with silence padding and a short crossfade."""
+    gap_ms = LONG_TEXT_GAP_MS if gap_ms is None else gap_ms
+    crossfade_ms = LONG_TEXT_CROSSFADE_MS if crossfade_ms is None else crossfade_ms
+    combined = None
+    for segment in segments:
+        if combined is None:
+            combined = segment
+            continue
+        if gap_ms:
+            combined += AudioSegment.silent(duration=gap_ms, frame_rate=combined.frame_rate)
+        fade = min(crossfade_ms, len(combined), len(segment))
+        combined = combined.append(segment, crossfade=fade)
+    return combined
+
+
+def render_chunks(mp3_chunks, dest, audio_format="mp3"):
+    """
+    Decode synthesized mp3 chunks, stitch them and export to dest. Returns
+    (seconds spent per stage, descriptors of the stitched audio); picklable so
+    it can run in a worker process.
+    """
+    started = time.perf_counter()
+    segments = [AudioSegment.from_file(io.BytesIO(data), format="mp3") for data in mp3_chunks]
+    decoded = time.perf_counter()
+    stitched = stitch_segments(segments)
+    stitched.export(dest, format=audio_format)
+    encoded = time.perf_counter()
+    descriptors = audio_descriptors.describe_segment(stitched)
+    return ({"decode": decoded - started, "encode": encoded - decoded,
+             "describe": time.perf_counter() - encoded}, descriptors)
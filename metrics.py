@@ -0,0 +1,230 @@
+"""
+Per-stage timing for synthesis tasks and an aggregated, Prometheus-style
+exposition of counters and histograms. Aggregates live in Redis so the web
+process can expose what every worker observed.
+"""
+import math, os, threading, time
+from contextlib import contextmanager
+import redis
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+redis_client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+PREFIX = "metrics"
+
+# Upper bounds (seconds) shared by every histogram; +Inf is implicit
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+HELP = {
+    "tts_tasks_total": ("counter", "Synthesis task outcomes"),
+    "tts_retries_total": ("counter", "Synthesis task retries scheduled"),
+    "tts_provider_throttled_total": ("counter", "ElevenLabs 429 responses, per API key fingerprint"),
+    "tts_stage_seconds": ("histogram", "Time spent per synthesis stage"),
+    "tts_task_seconds": ("histogram", "Total synthesis task time, start to metadata written"),
+    "tts_queue_wait_seconds": ("histogram", "Submission to task start, per scheduling lane"),
+    "tts_lane_queued": ("gauge", "Messages waiting in a lane's broker queue"),
+    "tts_lane_held": ("gauge", "Batch items held back by fair-share scheduling"),
+    "tts_lane_in_flight": ("gauge", "Batch items released to the batch queue and not yet finished"),
+    "tts_lane_users_waiting": ("gauge", "Users with batch items held back"),
+    "tts_worker_tasks_in_flight": ("gauge", "Tasks executing in a worker process"),
+    "tts_worker_cpu_jobs_running": ("gauge", "Decode/encode jobs running in a worker's process pool"),
+    "tts_worker_cpu_jobs_queued": ("gauge", "Decode/encode jobs waiting for a worker's process pool"),
+}
+# Gauges not refreshed within this many seconds belong to a dead process
+GAUGE_STALE_SECONDS = 30
+
+
+class StageTimer:
+    """Accumulates seconds per named stage; safe to share across threads."""
+
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + max(0.0, seconds)
+
+    def get(self, name):
+        with self._lock:
+            return self.stages.get(name, 0.0)
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def as_dict(self):
+        with self._lock:
+            return {name: round(seconds, 6) for name, seconds in self.stages.items()}
+
+
+_local = threading.local()
+
+
+def current_timer():
+    """The StageTimer bound to this thread, if any."""
+    return getattr(_local, "timer", None)
+
+
+@contextmanager
+def track(timer):
+    """Bind timer to the current thread so lower layers (HTTP adapter) can report."""
+    previous = getattr(_local, "timer", None)
+    _local.timer = timer
+    try:
+        yield timer
+    finally:
+        _local.timer = previous
+
+
+class _TimedConnectMixin:
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            timer = current_timer()
+            if timer is not None:
+                timer.add("http_connect", time.perf_counter() - started)
+
+
+class _TimedHTTPConnection(_TimedConnectMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """requests adapter that reports TCP+TLS connect time to the thread's StageTimer."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+def timed_request(session, method, url, **kwargs):
+    """
+    Issue a request and read the body, splitting the time into http_connect
+    (via TimedHTTPAdapter), http_ttfb and http_download on the current timer.
+    """
+    timer = current_timer() or StageTimer()
+    connect_before = timer.get("http_connect")
+    started = time.perf_counter()
+    response = session.request(method, url, stream=True, **kwargs)
+    headers_at = time.perf_counter()
+    connect = timer.get("http_connect") - connect_before
+    timer.add("http_ttfb", headers_at - started - connect)
+    with timer.stage("http_download"):
+        response.content
+    return response
+
+
+def _label_string(labels):
+    if not labels:
+        return ""
+    return ",".join(f'{k}="{str(v)}"' for k, v in sorted(labels.items()))
+
+
+def inc(name, labels=None, amount=1, pipe=None):
+    target = pipe or redis_client
+    target.hincrbyfloat(f"{PREFIX}:counter:{name}", _label_string(labels), amount)
+
+
+def observe(name, value, labels=None, pipe=None):
+    target = pipe or redis_client
+    key = f"{PREFIX}:histogram:{name}"
+    labels_str = _label_string(labels)
+    le = next((str(b) for b in BUCKETS if value <= b), "+Inf")
+    target.hincrby(key, f"{labels_str}|{le}", 1)
+    target.hincrby(key, f"{labels_str}|count", 1)
+    target.hincrbyfloat(key, f"{labels_str}|sum", value)
+
+
+def set_gauge(name, value, labels=None):
+    """Latest value for one label set; stale entries are dropped when rendered."""
+    redis_client.hset(f"{PREFIX}:gauge:{name}", _label_string(labels), f"{value}|{time.time()}")
+
+
+def record_task(stages, total_seconds, status, cache_hit=False, retries=0):
+    """Publish one finished (or failed) task's timings to the aggregate metrics."""
+    pipe = redis_client.pipeline(transaction=False)
+    inc("tts_tasks_total", {"status": status, "cache": "hit" if cache_hit else "miss"}, pipe=pipe)
+    if retries and status != "retry":
+        inc("tts_retries_total", {"outcome": status}, amount=retries, pipe=pipe)
+    for stage, seconds in stages.items():
+        observe("tts_stage_seconds", seconds, {"stage": stage}, pipe=pipe)
+    if total_seconds is not None:
+        observe("tts_task_seconds", total_seconds, {"status": status}, pipe=pipe)
+    pipe.execute()
+
+
+def _format_value(value):
+    value = float(value)
+    if math.isinf(value):
+        return "+Inf"
+    return repr(int(value)) if value.is_integer() else repr(value)
+
+
+def _with_label(labels_str, extra):
+    return "{" + ",".join(part for part in (labels_str, extra) if part) + "}"
+
+
+def render():
+    """Prometheus text exposition format (version 0.0.4)."""
+    names = list(HELP)
+    pipe = redis_client.pipeline(transaction=False)
+    for name in names:
+        pipe.hgetall(f"{PREFIX}:{HELP[name][0]}:{name}")
+    lines = []
+    for name, raw in zip(names, pipe.execute()):
+        kind, description = HELP[name]
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        fields = {k.decode(): v.decode() for k, v in raw.items()}
+        if kind == "gauge":
+            for labels_str, packed in sorted(fields.items()):
+                value, _, updated = packed.partition("|")
+                if time.time() - float(updated or 0) > GAUGE_STALE_SECONDS:
+                    redis_client.hdel(f"{PREFIX}:gauge:{name}", labels_str)
+                    continue
+                label_part = _with_label(labels_str, "") if labels_str else ""
+                lines.append(f"{name}{label_part} {_format_value(value)}")
+            continue
+        if kind == "counter":
+            for labels_str, value in sorted(fields.items()):
+                label_part = _with_label(labels_str, "") if labels_str else ""
+                lines.append(f"{name}{label_part} {_format_value(value)}")
+            continue
+
+        series = {}
+        for field, value in fields.items():
+            labels_str, _, suffix = field.rpartition("|")
+            series.setdefault(labels_str, {})[suffix] = value
+        for labels_str, values in sorted(series.items()):
+            cumulative = 0
+            for bound in [str(b) for b in BUCKETS] + ["+Inf"]:
+                cumulative += int(values.get(bound, 0))
+                le_label = 'le="%s"' % bound
+                lines.append(f"{name}_bucket{_with_label(labels_str, le_label)} {cumulative}")
+            label_part = _with_label(labels_str, "") if labels_str else ""
+            lines.append(f"{name}_sum{label_part} {_format_value(values.get('sum', 0))}")
+            lines.append(f"{name}_count{label_part} {_format_value(values.get('count', 0))}")
+    return "\n".join(lines) + "\n"
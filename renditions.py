@@ -0,0 +1,153 @@
+"""
+Extra renditions of a synthesized file (other formats, bitrates, sample
+rates), always produced from audio we already have so the provider is never
+paid twice for the same speech.
+
+A rendition is written "format[:bitrate][@sample_rate]", e.g. "wav",
+"mp3:64k" or "ogg:96k@24000". It is stored in its own storage shard as
+<source name>.<format>-<bitrate>-<rate>.<ext>.
+
+Renditions first asked for through /audio are encoded by a worker, never in
+the web request; claim_job keeps a burst of identical requests to one task.
+An encode that fails is remembered for a while, so clients get the error
+instead of waiting on a rendition that will never appear.
+"""
+import os, re, uuid
+from concurrent.futures import ThreadPoolExecutor
+import redis
+from pydub import AudioSegment
+import audio_descriptors
+import single_flight
+import storage
+import transcode
+
+FORMATS = ("mp3", "wav", "ogg", "flac")
+# ffmpeg processes encoding one master's renditions at once
+RENDITION_PARALLEL_ENCODES = int(os.getenv("RENDITION_PARALLEL_ENCODES", 4))
+# How long a queued on-demand encode blocks identical requests if it never finishes
+JOB_LEASE_SECONDS = 300
+# How long a failed on-demand encode is reported before it may be tried again
+FAILED_TTL_SECONDS = int(os.getenv("RENDITION_FAILED_TTL", 300))
+
+redis_client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+
+_SPEC_RE = re.compile(r"^(?P<format>[a-z0-9]+)(?::(?P<bitrate>\d+k))?(?:@(?P<sample_rate>\d+))?$")
+
+
+def parse(spec):
+    """Rendition spec string -> dict; ValueError for anything unsupported."""
+    match = _SPEC_RE.match((spec or "").strip().lower())
+    if not match or match["format"] not in FORMATS:
+        raise ValueError(f"Unsupported rendition: {spec!r}")
+    sample_rate = int(match["sample_rate"]) if match["sample_rate"] else None
+    if sample_rate is not None and not 8000 <= sample_rate <= 96000:
+        raise ValueError(f"Unsupported sample rate in rendition: {spec!r}")
+    return {"format": match["format"], "bitrate": match["bitrate"], "sample_rate": sample_rate}
+
+
+def canonical(rendition):
+    spec = rendition["format"]
+    if rendition["bitrate"]:
+        spec += f":{rendition['bitrate']}"
+    if rendition["sample_rate"]:
+        spec += f"@{rendition['sample_rate']}"
+    return spec
+
+
+def rendition_path(source, rendition):
+    tag = "-".join(str(part) for part in (rendition["format"], rendition["bitrate"],
+                                          rendition["sample_rate"]) if part)
+    return storage.audio_path(f"{os.path.basename(source)}.{tag}.{rendition['format']}")
+
+
+def _output_args(rendition):
+    args = []
+    if rendition["bitrate"]:
+        args += ["-b:a", rendition["bitrate"]]
+    if rendition["sample_rate"]:
+        args += ["-ar", str(rendition["sample_rate"])]
+    return args
+
+
+def encode_all(source, specs, describe=False):
+    """
+    Decode source once and encode every missing rendition in parallel.
+    Returns {canonical spec: path}; picklable for worker_pool.run_cpu. With
+    describe=True returns (paths, descriptors of source) from the same decode.
+    """
+    wanted = {}
+    for spec in specs:
+        rendition = parse(spec)
+        wanted[canonical(rendition)] = (rendition, rendition_path(source, rendition))
+    missing = [(r, path) for r, path in wanted.values() if not os.path.exists(path)]
+    descriptors = None
+    if missing or describe:
+        audio = AudioSegment.from_file(source).set_sample_width(2)
+        pcm = audio.raw_data
+
+        def encode(item):
+            rendition, path = item
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            transcode.encode_pcm(pcm, path, rendition["format"], audio.frame_rate,
+                                 audio.channels, _output_args(rendition))
+
+        with ThreadPoolExecutor(max_workers=max(1, min(RENDITION_PARALLEL_ENCODES,
+                                                       len(missing)))) as pool:
+            encoded = pool.map(encode, missing)
+            if describe:
+                # Describe on this thread while ffmpeg encodes
+                descriptors = audio_descriptors.describe_segment(audio)
+            list(encoded)
+    paths = {spec: path for spec, (_, path) in wanted.items()}
+    return (paths, descriptors) if describe else paths
+
+
+def lookup(source, spec):
+    """Path of an already encoded rendition of source, or None; ValueError for bad specs."""
+    path = rendition_path(source, parse(spec))
+    return path if os.path.exists(path) else None
+
+
+def ensure(source, spec):
+    """
+    Path of one rendition of source, transcoding it on first request. Identical
+    concurrent requests across processes share a single encode. Blocks for the
+    whole decode and encode, so call it from workers.
+    """
+    rendition = parse(spec)
+    path = rendition_path(source, rendition)
+    if os.path.exists(path):
+        return path
+
+    def produce():
+        return encode_all(source, [canonical(rendition)])[canonical(rendition)]
+
+    path, _ = single_flight.run(f"rendition:{path}", uuid.uuid4().hex, produce)
+    return path
+
+
+def _job_key(source, spec):
+    return f"rendition_job:{rendition_path(source, parse(spec))}"
+
+
+def claim_job(source, spec):
+    """True if the caller should queue the encode; False if one is already queued."""
+    return bool(redis_client.set(_job_key(source, spec), 1, nx=True, ex=JOB_LEASE_SECONDS))
+
+
+def release_job(source, spec):
+    redis_client.delete(_job_key(source, spec))
+
+
+def _failed_key(source, spec):
+    return f"rendition_failed:{rendition_path(source, parse(spec))}"
+
+
+def mark_failed(source, spec, reason):
+    redis_client.set(_failed_key(source, spec), reason, ex=FAILED_TTL_SECONDS)
+
+
+def failure(source, spec):
+    """Why the last encode of this rendition failed, or None."""
+    reason = redis_client.get(_failed_key(source, spec))
+    return reason.decode() if reason is not None else None
@@ -0,0 +1,121 @@
+"""
+Coalesces identical in-flight syntheses across workers. The first task for a
+cache key takes a Redis lease and does the work; tasks arriving meanwhile
+wait for it and reuse its output instead of paying for another API call.
+
+The leader renews its lease while working, so a crashed worker's lease runs
+out within LEASE_SECONDS and a waiting follower takes over.
+"""
+import logging, os, threading, time
+import redis
+
+LEASE_SECONDS = int(os.getenv("SINGLE_FLIGHT_LEASE_SECONDS", 30))
+# How long a follower waits for leaders (including takeovers) before failing
+FOLLOWER_MAX_WAIT = int(os.getenv("SINGLE_FLIGHT_MAX_WAIT", 600))
+# The leader's result stays readable this long after its lease is released;
+# shorter than storage.MIN_AGE_SECONDS so the file it names is still there
+RESULT_TTL = 300
+
+redis_client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+
+# Only the owner may renew or release a lease
+_RENEW = redis_client.register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+""")
+_RELEASE = redis_client.register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+""")
+
+
+class FollowerTimeout(Exception):
+    pass
+
+
+def _lease_key(key):
+    return f"single_flight:{key}"
+
+
+def _result_key(key):
+    return f"single_flight:{key}:result"
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _heartbeat(key, owner, stop):
+    while not stop.wait(LEASE_SECONDS / 3):
+        try:
+            if not _RENEW(keys=[_lease_key(key)], args=[owner, LEASE_SECONDS]):
+                logging.warning("Lost single-flight lease %s to another worker", key)
+                return
+        except redis.RedisError:
+            logging.exception("Failed to renew single-flight lease %s", key)
+
+
+def _published(key):
+    """(result, leader) of the latest leader's published result, or None."""
+    published = redis_client.get(_result_key(key))
+    if published is None:
+        return None
+    leader, _, result = _decode(published).partition("|")
+    return result, leader
+
+
+def _lead(key, owner, produce):
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(key, owner, stop), daemon=True).start()
+    try:
+        result = produce()
+        # Result first, then release, so a follower that sees the lease gone
+        # always finds the result
+        redis_client.set(_result_key(key), f"{owner}|{result}", ex=RESULT_TTL)
+        return result
+    finally:
+        stop.set()
+        _RELEASE(keys=[_lease_key(key)], args=[owner])
+
+
+def run(key, owner, produce, on_wait=None):
+    """
+    Run produce() once per key across all workers. Returns (result, leader):
+    leader == owner when this caller did the work; otherwise result is the
+    leader's (a string, e.g. an output path). on_wait(leader) is called once
+    when this caller starts waiting. produce() runs inside the lease, so it is
+    the place to re-check caches a previous leader may just have filled.
+    """
+    deadline = time.monotonic() + FOLLOWER_MAX_WAIT
+    waited_on = None
+    while True:
+        if redis_client.set(_lease_key(key), owner, nx=True, ex=LEASE_SECONDS):
+            # A previous leader may have finished between our caller's cache
+            # miss and this lease; reuse its result rather than redo the work
+            published = _published(key)
+            if published is not None:
+                _RELEASE(keys=[_lease_key(key)], args=[owner])
+                return published
+            return _lead(key, owner, produce), owner
+
+        leader = _decode(redis_client.get(_lease_key(key)))
+        if leader is None:
+            continue
+        if waited_on is None and on_wait is not None:
+            on_wait(leader)
+        waited_on = leader
+        delay = 0.05
+        while redis_client.exists(_lease_key(key)):
+            if time.monotonic() > deadline:
+                raise FollowerTimeout(f"Gave up waiting for {leader} to synthesize {key}")
+            time.sleep(delay)
+            delay = min(1.0, delay * 1.5)
+        published = _published(key)
+        if published is not None:
+            return published
+        # The leader failed or died without a result; contend to take over
+        logging.info("Single-flight leader %s for %s finished without a result", waited_on, key)
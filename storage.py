@@ -0,0 +1,270 @@
+"""
+Sharded on-disk layout for synthesized audio and task metadata, kept under a
+byte quota by least-recently-used eviction:
+
+    output_audio/<aa>/<bb>/<file name>       aa, bb from sha1 of the file name
+    tasks_metadata/<aa>/<task id>.json       aa from sha1 of the task id
+
+Files in the old flat layout are still found until they are moved with
+
+    python storage.py migrate
+
+and `python storage.py gc` (also the periodic storage_gc task) evicts audio
+over quota, marks the affected tasks' metadata as evicted, clears temp files
+left by crashed writers and removes empty shard directories.
+"""
+import datetime, hashlib, json, logging, os, shutil, sys, time, uuid
+import task_index
+
+OUTPUT_DIR = "output_audio"
+METADATA_DIR = "tasks_metadata"
+# Subdirectories of OUTPUT_DIR with their own eviction (see derivatives.py)
+RESERVED_DIRS = ("derived",)
+STORAGE_MAX_BYTES = int(os.getenv("STORAGE_MAX_BYTES", 10 * 1024 ** 3))
+STORAGE_MIN_FREE_BYTES = int(os.getenv("STORAGE_MIN_FREE_BYTES", 1024 ** 3))
+# Access times are refreshed at most this often, sparing a write per request
+TOUCH_INTERVAL_SECONDS = 3600
+# Files younger than this are never evicted; their task may still be running
+MIN_AGE_SECONDS = 600
+# .part/.tmp files older than this were left behind by a crashed writer
+STALE_TEMP_SECONDS = 3600
+os.makedirs(OUTPUT_DIR, exist_ok=True)
+os.makedirs(METADATA_DIR, exist_ok=True)
+
+
+def _shard(name, levels):
+    digest = hashlib.sha1(name.encode("utf-8")).hexdigest()
+    return [digest[2 * i:2 * i + 2] for i in range(levels)]
+
+
+def audio_path(name):
+    """Sharded location of an output file name."""
+    return os.path.join(OUTPUT_DIR, *_shard(name, 2), name)
+
+
+def new_audio_path(prefix="output", ext="mp3"):
+    """A fresh, unique, timestamped output path; its shard directory exists."""
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = audio_path(f"{prefix}_{timestamp}_{uuid.uuid4().hex[:8]}.{ext}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def locate_audio(name):
+    """Existing path of an output file, sharded or still flat; None if gone."""
+    for path in (audio_path(name), os.path.join(OUTPUT_DIR, name)):
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def metadata_path(task_id):
+    return os.path.join(METADATA_DIR, *_shard(task_id, 1), f"{task_id}.json")
+
+
+def find_metadata(task_id):
+    """Existing metadata file of a task, sharded or still flat; None if missing."""
+    for path in (metadata_path(task_id), os.path.join(METADATA_DIR, f"{task_id}.json")):
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def read_metadata(task_id):
+    path = find_metadata(task_id)
+    if path is None:
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_metadata(task_id, metadata):
+    """Atomically write a task's metadata to its shard; returns the path."""
+    path = metadata_path(task_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def touch(path):
+    """Record an access for LRU eviction, at most once per TOUCH_INTERVAL_SECONDS."""
+    try:
+        st = os.stat(path)
+        now = time.time()
+        if now - st.st_atime > TOUCH_INTERVAL_SECONDS:
+            os.utime(path, (now, st.st_mtime))
+    except OSError:
+        pass
+
+
+def _walk_files(root, skip=()):
+    for dirpath, dirnames, filenames in os.walk(root):
+        if dirpath == root:
+            dirnames[:] = [d for d in dirnames if d not in skip]
+        for name in filenames:
+            yield dirpath, name
+
+
+def _mark_evicted(path):
+    """Keep metadata truthful: tasks whose audio was evicted say so."""
+    evicted_at = datetime.datetime.utcnow().isoformat() + "Z"
+    for task_id in task_index.tasks_for_output(path):
+        try:
+            metadata = read_metadata(task_id)
+            if metadata is None:
+                continue
+            metadata["evicted"] = True
+            metadata["evicted_at"] = evicted_at
+            write_metadata(task_id, metadata)
+            task_index.index_task(metadata)
+        except Exception:
+            logging.exception("Failed to mark task %s as evicted", task_id)
+
+
+def evict(max_bytes=None, min_free_bytes=None):
+    """
+    Delete the least recently accessed audio while over max_bytes or while the
+    disk has less than min_free_bytes free. Returns (evicted, bytes remaining).
+    """
+    max_bytes = STORAGE_MAX_BYTES if max_bytes is None else max_bytes
+    min_free_bytes = STORAGE_MIN_FREE_BYTES if min_free_bytes is None else min_free_bytes
+    # Paths per inode under OUTPUT_DIR: hard links (cache hits, shared
+    # in-flight results) share their bytes, which count against the quota
+    # until the last of them here is gone, whatever links remain elsewhere
+    entries, total, links = [], 0, {}
+    for dirpath, name in _walk_files(OUTPUT_DIR, RESERVED_DIRS):
+        if name.endswith((".part", ".tmp")):
+            continue
+        path = os.path.join(dirpath, name)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        inode = (st.st_dev, st.st_ino)
+        if inode not in links:
+            links[inode] = 0
+            total += st.st_size
+        links[inode] += 1
+        entries.append((st.st_atime, st.st_size, st.st_mtime, inode, path))
+
+    entries.sort()
+    free = shutil.disk_usage(OUTPUT_DIR).free
+    cutoff = time.time() - MIN_AGE_SECONDS
+    evicted = 0
+    for _, size, mtime, inode, path in entries:
+        if total <= max_bytes and free >= min_free_bytes:
+            break
+        if mtime > cutoff:
+            continue
+        try:
+            nlink = os.stat(path).st_nlink
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        links[inode] -= 1
+        if links[inode] == 0:
+            total -= size
+        # Disk space only comes back with the inode's last link anywhere
+        if nlink == 1:
+            free += size
+        evicted += 1
+        _mark_evicted(path)
+
+    if evicted:
+        logging.info("Evicted %d audio files, %d bytes remain", evicted, total)
+    return evicted, total
+
+
+def _remove_stale_temp_files():
+    cutoff = time.time() - STALE_TEMP_SECONDS
+    removed = 0
+    for root in (OUTPUT_DIR, METADATA_DIR):
+        for dirpath, name in _walk_files(root):
+            if not name.endswith((".part", ".tmp")):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+def _remove_empty_shards():
+    removed = 0
+    # new_audio_path creates a shard when a task starts; it stays empty until
+    # the provider answers, and must still be there when the file is written
+    cutoff = time.time() - MIN_AGE_SECONDS
+    for root in (OUTPUT_DIR, METADATA_DIR):
+        for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+            if dirpath == root or os.path.relpath(dirpath, root).split(os.sep)[0] in RESERVED_DIRS:
+                continue
+            try:
+                if os.stat(dirpath).st_mtime > cutoff:
+                    continue
+                os.rmdir(dirpath)
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def gc():
+    """Compaction pass: temp files, quota eviction, empty shard directories."""
+    temp_files = _remove_stale_temp_files()
+    evicted, remaining = evict()
+    return {
+        "temp_files_removed": temp_files,
+        "evicted": evicted,
+        "bytes_remaining": remaining,
+        "empty_dirs_removed": _remove_empty_shards(),
+    }
+
+
+def migrate():
+    """
+    Move flat-layout audio and metadata into shards, rewriting output_file
+    references. Safe to run while serving and to re-run.
+    """
+    moved_audio = 0
+    for entry in list(os.scandir(OUTPUT_DIR)):
+        if entry.is_file() and not entry.name.endswith((".part", ".tmp")):
+            dest = audio_path(entry.name)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            os.replace(entry.path, dest)
+            moved_audio += 1
+
+    moved_metadata = 0
+    for entry in list(os.scandir(METADATA_DIR)):
+        if not (entry.is_file() and entry.name.endswith(".json")):
+            continue
+        try:
+            with open(entry.path, "r") as f:
+                metadata = json.load(f)
+            task_id = metadata.setdefault("task_id", entry.name[:-len(".json")])
+            output_file = metadata.get("output_file")
+            if output_file and not os.path.exists(output_file):
+                metadata["output_file"] = locate_audio(os.path.basename(output_file)) or output_file
+            write_metadata(task_id, metadata)
+            os.remove(entry.path)
+            task_index.index_task(metadata)
+            moved_metadata += 1
+        except Exception:
+            logging.exception("Failed to migrate task metadata %s", entry.path)
+    return moved_audio, moved_metadata
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "migrate":
+        audio, metadata = migrate()
+        print(f"Moved {audio} audio file(s) and {metadata} metadata file(s) into shards")
+    elif command == "gc":
+        print(json.dumps(gc(), indent=2))
+    else:
+        sys.exit("usage: python storage.py migrate|gc")
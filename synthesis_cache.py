@@ -0,0 +1,167 @@
+import hashlib, json, logging, os, shutil, time
+import redis
+
+# Content-addressed store of synthesized audio, keyed by the request parameters
+CACHE_DIR = os.getenv("SYNTHESIS_CACHE_DIR", "synthesis_cache")
+CACHE_MAX_BYTES = int(os.getenv("SYNTHESIS_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+CACHE_TTL_SECONDS = int(os.getenv("SYNTHESIS_CACHE_TTL", 7 * 24 * 3600))
+os.makedirs(CACHE_DIR, exist_ok=True)
+
+# Hit/miss counters live in Redis so every worker contributes to the same totals
+STATS_KEY = "synthesis_cache:stats"
+redis_client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+
+
+def cache_key(text, voice_id, emotion_level, stability, similarity_boost,
+              pitch, rate, audio_format):
+    """Canonical SHA-256 of everything that influences the synthesized audio."""
+    params = {
+        "text": text,
+        "voice_id": voice_id,
+        "emotion": emotion_level,
+        "stability": round(float(stability), 4),
+        "similarity_boost": round(float(similarity_boost), 4),
+        "pitch": round(float(pitch), 4),
+        "rate": round(float(rate), 4),
+        "format": (audio_format or "mp3").lower(),
+    }
+    canonical = json.dumps(params, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _entry_path(key, audio_format):
+    return os.path.join(CACHE_DIR, f"{key}.{audio_format}")
+
+
+def _count(field):
+    try:
+        redis_client.hincrby(STATS_KEY, field, 1)
+    except redis.RedisError:
+        logging.warning("Could not update synthesis cache %s counter", field)
+
+
+def lookup(key, audio_format, count=True):
+    """
+    Return the cached file for key, or None on a miss or an expired entry.
+    Only a request's first lookup should count; re-checks and probes for
+    other formats pass count=False so the hit ratio stays per request.
+    """
+    path = _entry_path(key, audio_format)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        if count:
+            _count("misses")
+        return None
+    if CACHE_TTL_SECONDS and time.time() - st.st_mtime > CACHE_TTL_SECONDS:
+        _remove(path)
+        if count:
+            _count("misses")
+        return None
+    # Bump access time so LRU eviction keeps hot entries; mtime keeps the TTL origin
+    os.utime(path, (time.time(), st.st_mtime))
+    if count:
+        _count("hits")
+    return path
+
+
+def materialize(cached_path, dest):
+    """Place a cached entry at dest, hard-linking when the filesystem allows it."""
+    try:
+        os.link(cached_path, dest)
+    except OSError:
+        shutil.copyfile(cached_path, dest)
+    return dest
+
+
+def store(key, audio_format, source_path):
+    """Add a freshly synthesized file to the cache and enforce the size policy."""
+    path = _entry_path(key, audio_format)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, path)
+    except OSError:
+        logging.exception("Could not store %s in synthesis cache", source_path)
+        _remove(tmp_path)
+        return None
+    evict()
+    return path
+
+
+def store_bytes(key, audio_format, data):
+    """Cache encoded audio held in memory, e.g. the provider's mp3 master."""
+    path = _entry_path(key, audio_format)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError:
+        logging.exception("Could not store %s entry %s in synthesis cache", audio_format, key)
+        _remove(tmp_path)
+        return None
+    evict()
+    return path
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def evict(max_bytes=None, ttl_seconds=None):
+    """Drop expired entries, then least recently used ones until under max_bytes."""
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    ttl_seconds = CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+    now = time.time()
+    entries, total, evicted = [], 0, 0
+    for entry in os.scandir(CACHE_DIR):
+        if not entry.is_file() or entry.name.endswith(".tmp"):
+            continue
+        st = entry.stat()
+        if ttl_seconds and now - st.st_mtime > ttl_seconds:
+            _remove(entry.path)
+            evicted += 1
+            continue
+        entries.append((st.st_atime, st.st_size, entry.path))
+        total += st.st_size
+
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        _remove(path)
+        total -= size
+        evicted += 1
+
+    if evicted:
+        logging.info("Synthesis cache evicted %d entries, %d bytes remain", evicted, total)
+        try:
+            redis_client.hincrby(STATS_KEY, "evictions", evicted)
+        except redis.RedisError:
+            pass
+    return evicted
+
+
+def stats():
+    """Hit/miss/eviction counters plus the current on-disk footprint."""
+    try:
+        raw = redis_client.hgetall(STATS_KEY)
+    except redis.RedisError:
+        raw = {}
+    counters = {k.decode(): int(v) for k, v in raw.items()}
+    hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+    entries = [e for e in os.scandir(CACHE_DIR) if e.is_file() and not e.name.endswith(".tmp")]
+    return {
+        "hits": hits,
+        "misses": misses,
+        "evictions": counters.get("evictions", 0),
+        "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        "entries": len(entries),
+        "bytes": sum(e.stat().st_size for e in entries),
+        "max_bytes": CACHE_MAX_BYTES,
+        "ttl_seconds": CACHE_TTL_SECONDS,
+    }
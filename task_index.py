@@ -0,0 +1,239 @@
+"""
+Indexed store of task metadata in SQLite, so the dashboard and analytics never
+have to scan METADATA_DIR. The JSON files stay the source of truth; this index
+is rebuilt from them with:
+
+    python task_index.py import [tasks_metadata]
+"""
+import base64, datetime, json, logging, os, sqlite3, sys, threading
+
+TASK_INDEX_DB = os.getenv("TASK_INDEX_DB", os.path.join("instance", "voice_synthesis.db"))
+SORT_COLUMNS = ("timestamp", "duration_seconds")
+PAGE_SIZE = 50
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS task_index (
+    task_id TEXT PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    voice_id TEXT,
+    format TEXT,
+    duration_seconds REAL NOT NULL DEFAULT 0,
+    text_chars INTEGER NOT NULL DEFAULT 0,
+    output_file TEXT,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_task_index_timestamp ON task_index (timestamp, task_id);
+CREATE INDEX IF NOT EXISTS ix_task_index_duration ON task_index (duration_seconds, task_id);
+CREATE INDEX IF NOT EXISTS ix_task_index_voice ON task_index (voice_id, timestamp, task_id);
+CREATE INDEX IF NOT EXISTS ix_task_index_format ON task_index (format, timestamp, task_id);
+CREATE INDEX IF NOT EXISTS ix_task_index_output ON task_index (output_file);
+CREATE TABLE IF NOT EXISTS task_filter_values (
+    column_name TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (column_name, value)
+) WITHOUT ROWID;
+"""
+FILTER_COLUMNS = ("voice_id", "format")
+
+_local = threading.local()
+
+
+def connect():
+    """Per-thread (and per-process, for forked Celery workers) connection."""
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid():
+        os.makedirs(os.path.dirname(TASK_INDEX_DB) or ".", exist_ok=True)
+        conn = sqlite3.connect(TASK_INDEX_DB, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        if conn.execute("SELECT 1 FROM task_filter_values LIMIT 1").fetchone() is None:
+            _backfill_filter_values(conn)
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+
+def _row(metadata):
+    return (
+        metadata["task_id"],
+        metadata.get("timestamp", ""),
+        metadata.get("voice_id"),
+        metadata.get("format"),
+        float(metadata.get("duration_seconds") or 0),
+        len(metadata.get("text", "")),
+        metadata.get("output_file"),
+        json.dumps(metadata),
+    )
+
+
+_UPSERT = """
+INSERT INTO task_index (task_id, timestamp, voice_id, format, duration_seconds,
+                        text_chars, output_file, metadata)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(task_id) DO UPDATE SET
+    timestamp=excluded.timestamp, voice_id=excluded.voice_id, format=excluded.format,
+    duration_seconds=excluded.duration_seconds, text_chars=excluded.text_chars,
+    output_file=excluded.output_file, metadata=excluded.metadata
+"""
+
+
+_ADD_FILTER_VALUE = "INSERT OR IGNORE INTO task_filter_values (column_name, value) VALUES (?, ?)"
+
+
+def _filter_values(metadata):
+    return [(column, metadata[column]) for column in FILTER_COLUMNS
+            if metadata.get(column) is not None]
+
+
+def _backfill_filter_values(conn):
+    """Filter values of an index built before they were kept on the side."""
+    with conn:
+        for column in FILTER_COLUMNS:
+            conn.execute(f"INSERT OR IGNORE INTO task_filter_values (column_name, value) "
+                         f"SELECT DISTINCT ?, {column} FROM task_index WHERE {column} IS NOT NULL",
+                         (column,))
+
+
+def index_task(metadata):
+    """Insert or update one task's metadata."""
+    conn = connect()
+    with conn:
+        conn.execute(_UPSERT, _row(metadata))
+        conn.executemany(_ADD_FILTER_VALUE, _filter_values(metadata))
+
+
+def get_task(task_id):
+    row = connect().execute("SELECT metadata FROM task_index WHERE task_id = ?",
+                            (task_id,)).fetchone()
+    return json.loads(row["metadata"]) if row else None
+
+
+def encode_cursor(sort_value, task_id):
+    raw = json.dumps([sort_value, task_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(sort value, task id) of a cursor from encode_cursor; ValueError otherwise."""
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(padded))
+    except ValueError:
+        raise ValueError(f"Malformed cursor: {cursor!r}") from None
+    if not (isinstance(decoded, list) and len(decoded) == 2 and isinstance(decoded[1], str)
+            and isinstance(decoded[0], (str, int, float)) and not isinstance(decoded[0], bool)):
+        raise ValueError(f"Malformed cursor: {cursor!r}")
+    sort_value, task_id = decoded
+    return sort_value, task_id
+
+
+def _filters(voice_id=None, audio_format=None, date_from=None, date_to=None):
+    clauses, params = [], []
+    if voice_id:
+        clauses.append("voice_id = ?")
+        params.append(voice_id)
+    if audio_format:
+        clauses.append("format = ?")
+        params.append(audio_format)
+    if date_from:
+        clauses.append("timestamp >= ?")
+        params.append(date_from)
+    if date_to:
+        # Inclusive end date: everything before the start of the following day
+        day_after = datetime.date.fromisoformat(date_to) + datetime.timedelta(days=1)
+        clauses.append("timestamp < ?")
+        params.append(day_after.isoformat())
+    return clauses, params
+
+
+def query_tasks(voice_id=None, audio_format=None, date_from=None, date_to=None,
+                sort="timestamp", descending=True, cursor=None, limit=PAGE_SIZE):
+    """
+    One page of tasks, filtered and sorted in SQLite. Pages are keyset-based:
+    pass the returned next_cursor back to continue where this page ended.
+    Returns (tasks, next_cursor); next_cursor is None on the last page.
+    """
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f"Unsupported sort column: {sort}")
+    clauses, params = _filters(voice_id, audio_format, date_from, date_to)
+    if cursor:
+        sort_value, task_id = decode_cursor(cursor)
+        clauses.append(f"({sort}, task_id) {'<' if descending else '>'} (?, ?)")
+        params.extend([sort_value, task_id])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    direction = "DESC" if descending else "ASC"
+    rows = connect().execute(
+        f"SELECT {sort} AS sort_value, task_id, metadata FROM task_index {where} "
+        f"ORDER BY {sort} {direction}, task_id {direction} LIMIT ?",
+        params + [limit + 1]
+    ).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["sort_value"], rows[-1]["task_id"])
+    return [json.loads(r["metadata"]) for r in rows], next_cursor
+
+
+def distinct_values(column):
+    """
+    Distinct voice ids or formats, for filter dropdowns. Read from the small
+    side table index_task maintains, not by scanning task_index.
+    """
+    if column not in FILTER_COLUMNS:
+        raise ValueError(f"Unsupported column: {column}")
+    rows = connect().execute(
+        "SELECT value FROM task_filter_values WHERE column_name = ? ORDER BY value", (column,)
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def tasks_for_output(output_file):
+    """Ids of the tasks whose metadata points at output_file."""
+    rows = connect().execute("SELECT task_id FROM task_index WHERE output_file = ?",
+                             (output_file,)).fetchall()
+    return [r["task_id"] for r in rows]
+
+
+def _metadata_files(metadata_dir):
+    # Flat (legacy) and sharded layouts alike
+    for root, _, files in os.walk(metadata_dir):
+        for name in files:
+            if name.endswith(".json"):
+                yield name, os.path.join(root, name)
+
+
+def import_metadata_dir(metadata_dir, batch_size=1000):
+    """One-shot import of existing per-task JSON files; safe to re-run."""
+    conn = connect()
+    imported, failed, batch = 0, 0, []
+    for name, path in _metadata_files(metadata_dir):
+        try:
+            with open(path, "r") as f:
+                metadata = json.load(f)
+            metadata.setdefault("task_id", name[:-len(".json")])
+            batch.append(_row(metadata))
+        except Exception as e:
+            failed += 1
+            logging.error(f"Error importing task metadata {path}: {e}")
+            continue
+        if len(batch) >= batch_size:
+            with conn:
+                conn.executemany(_UPSERT, batch)
+            imported += len(batch)
+            batch = []
+    if batch:
+        with conn:
+            conn.executemany(_UPSERT, batch)
+        imported += len(batch)
+    _backfill_filter_values(conn)
+    return imported, failed
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "import":
+        sys.exit("usage: python task_index.py import [metadata_dir]")
+    source = sys.argv[2] if len(sys.argv) > 2 else "tasks_metadata"
+    imported, failed = import_metadata_dir(source)
+    print(f"Imported {imported} task(s) from {source} into {TASK_INDEX_DB} ({failed} failed)")
@@ -0,0 +1,35 @@
+"""
+Every module builds its Redis client at import time, so the fake server is
+installed before any of them is imported. fakeredis runs the Lua scripts
+through lupa. Storage paths are relative to the working directory, which is
+a scratch directory from the start (modules create theirs on import) and a
+fresh one per test that asks for it.
+"""
+import os, sys, tempfile
+import fakeredis
+import pytest
+import redis
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="tts-tests-"))
+
+_server = fakeredis.FakeServer()
+redis.Redis.from_url = lambda *args, **kwargs: fakeredis.FakeRedis(server=_server)
+
+
+@pytest.fixture(autouse=True)
+def clean_redis():
+    fakeredis.FakeRedis(server=_server).flushall()
+    yield
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Empty output, metadata, cache and index locations under tmp_path."""
+    import storage, synthesis_cache, task_index
+    monkeypatch.chdir(tmp_path)
+    for path in (storage.OUTPUT_DIR, storage.METADATA_DIR, synthesis_cache.CACHE_DIR):
+        os.makedirs(path, exist_ok=True)
+    monkeypatch.setattr(task_index, "TASK_INDEX_DB", str(tmp_path / "index.db"))
+    monkeypatch.setattr(task_index, "_local", type(task_index._local)())
+    return tmp_path
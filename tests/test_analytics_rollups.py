@@ -0,0 +1,45 @@
+import datetime, random
+import analytics_rollups
+
+
+def sketch_of(values):
+    sketch = {}
+    for value in values:
+        bucket = analytics_rollups._bucket(value)
+        sketch[bucket] = sketch.get(bucket, 0) + 1
+    return sketch
+
+
+def test_percentiles_are_within_the_sketch_accuracy():
+    rng = random.Random(7)
+    values = sorted(rng.lognormvariate(0, 1) for _ in range(5000))
+    estimated = analytics_rollups.percentiles(sketch_of(values))
+    for q in analytics_rollups.PERCENTILES:
+        exact = values[int(q * (len(values) - 1))]
+        error = abs(estimated[f"p{int(q * 100)}"] - exact) / exact
+        assert error <= analytics_rollups.SKETCH_RELATIVE_ACCURACY + 0.001
+
+
+def test_empty_and_instant_sketches():
+    assert analytics_rollups.percentiles({}) == {"p50": None, "p95": None, "p99": None}
+    assert analytics_rollups.percentiles(sketch_of([0, 0, 0.0005])) == {"p50": 0.0, "p95": 0.0,
+                                                                        "p99": 0.0}
+
+
+def test_redis_replies_with_bytes_keys_are_read():
+    sketch = {k.encode(): str(n).encode() for k, n in sketch_of([1.0, 2.0, 3.0]).items()}
+    assert abs(analytics_rollups.percentiles(sketch)["p50"] - 2.0) <= 0.02
+
+
+def test_snapshot_folds_recorded_tasks():
+    now = datetime.datetime.utcnow()
+    for voice, seconds in (("v1", 1.0), ("v1", 3.0), ("v2", 2.0)):
+        analytics_rollups.record_task({"text": "abcd", "voice_id": voice, "format": "mp3",
+                                       "duration_seconds": seconds,
+                                       "timestamp": now.isoformat() + "Z"})
+    snapshot = analytics_rollups.snapshot(now=now)
+    assert (snapshot["total_tasks"], snapshot["total_chars"], snapshot["avg_duration"]) == (3, 12, 2.0)
+    assert snapshot["voices"] == {"v1": 2, "v2": 1}
+    assert snapshot["emotions"] == {"unknown": 3}
+    assert snapshot["hourly"][-1]["tasks"] == snapshot["daily"][-1]["tasks"] == 3
+    assert abs(snapshot["latency_today"]["p50"] - 2.0) <= 0.02
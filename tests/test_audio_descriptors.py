@@ -0,0 +1,36 @@
+import numpy as np
+import audio_descriptors
+
+
+def tone(seconds, sample_rate=16000, channels=2, level=0.5):
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    wave = (level * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+    return np.repeat(wave[:, None], channels, axis=1)
+
+
+def test_blocks_of_any_size_describe_like_the_whole_signal():
+    samples = tone(7.3)
+    whole = audio_descriptors.describe(samples, 16000)
+    accumulator = audio_descriptors.Accumulator(16000, 2, len(samples))
+    for start in range(0, len(samples), 12345):
+        accumulator.feed(samples[start:start + 12345])
+    assert accumulator.result() == whole
+    assert whole["duration_seconds"] == 7.3
+    assert len(whole["waveform"]) == audio_descriptors.WAVEFORM_POINTS
+    assert abs(whole["peak_dbfs"] - 20 * np.log10(0.5)) < 0.05
+
+
+def test_unknown_length_still_fills_the_waveform():
+    samples = tone(7.0)
+    accumulator = audio_descriptors.Accumulator(16000, 2)
+    for start in range(0, len(samples), 16000):
+        accumulator.feed(samples[start:start + 16000])
+    result = accumulator.result()
+    assert len(result["waveform"]) == audio_descriptors.WAVEFORM_POINTS
+    assert result["loudness_lufs"] == audio_descriptors.describe(samples, 16000)["loudness_lufs"]
+
+
+def test_silence_has_null_levels():
+    result = audio_descriptors.describe(np.zeros((16000, 1), dtype=np.float32), 16000)
+    assert (result["peak_dbfs"], result["rms_dbfs"], result["loudness_lufs"]) == (None, None, None)
+    assert set(result["waveform"]) == {0.0}
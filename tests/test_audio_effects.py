@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+import audio_effects
+
+RATE = 48000
+
+
+def sine(freq, seconds, amplitude=1.0, channels=1, rate=RATE):
+    t = np.arange(int(seconds * rate)) / rate
+    wave = (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+    return np.repeat(wave[:, None], channels, axis=1)
+
+
+def dominant_frequency(samples, rate=RATE):
+    spectrum = np.abs(np.fft.rfft(samples[:, 0] * np.hanning(len(samples))))
+    return np.fft.rfftfreq(len(samples), 1 / rate)[np.argmax(spectrum)]
+
+
+def test_full_scale_997hz_sine_reads_minus_3_lufs():
+    # The BS.1770 calibration point
+    assert audio_effects.integrated_loudness(sine(997, 5), RATE) == pytest.approx(-3.01, abs=0.1)
+    # Both channels count: twice the power, +3 LU
+    assert audio_effects.integrated_loudness(sine(997, 5, channels=2), RATE) == pytest.approx(0.0, abs=0.1)
+
+
+def test_silence_and_too_short_audio_have_no_loudness():
+    assert audio_effects.integrated_loudness(np.zeros((RATE * 2, 1), np.float32), RATE) == float("-inf")
+    assert audio_effects.integrated_loudness(sine(997, 0.3), RATE) == float("-inf")
+
+
+def test_quiet_passages_are_gated_out():
+    loud = sine(997, 4, amplitude=0.5)
+    with_silence = np.concatenate([loud, np.zeros_like(loud)])
+    assert (audio_effects.integrated_loudness(with_silence, RATE)
+            == pytest.approx(audio_effects.integrated_loudness(loud, RATE), abs=0.2))
+
+
+@pytest.mark.parametrize("speed", [0.75, 1.5, 2.0])
+def test_time_stretch_changes_duration_not_pitch(speed):
+    samples = sine(440, 2.0, amplitude=0.5, channels=2)
+    out = audio_effects.time_stretch(samples, RATE, speed)
+    assert len(out) == int(round(len(samples) / speed))
+    assert out.shape[1] == 2
+    assert dominant_frequency(out) == pytest.approx(440, abs=5)
+    # Overlap-add of aligned frames keeps the level
+    middle = out[len(out) // 4: 3 * len(out) // 4]
+    assert np.abs(middle).max() == pytest.approx(0.5, abs=0.05)
+
+
+def test_time_stretch_edge_cases():
+    samples = sine(440, 0.5)
+    assert audio_effects.time_stretch(samples, RATE, 1.0) is samples
+    with pytest.raises(ValueError):
+        audio_effects.time_stretch(samples, RATE, 0)
+
+
+def test_normalize_reaches_the_target_under_the_peak_ceiling():
+    quiet = sine(997, 3, amplitude=0.05)
+    out = audio_effects.apply_effects(quiet, RATE, {"normalize": True, "target_lufs": -20.0})
+    assert audio_effects.integrated_loudness(out, RATE) == pytest.approx(-20.0, abs=0.1)
+    assert np.abs(quiet).max() == pytest.approx(0.05, abs=1e-3)
+    # -3 LUFS would need a peak above the -1 dBFS ceiling
+    out = audio_effects.apply_effects(quiet, RATE, {"normalize": True, "target_lufs": -3.0})
+    assert 20 * np.log10(np.abs(out).max()) == pytest.approx(audio_effects.NORMALIZE_PEAK_DBFS, abs=0.01)
+
+
+def test_volume_and_fades():
+    out = audio_effects.apply_effects(np.full((RATE, 1), 0.5, np.float32), RATE,
+                                      {"volume": -6.0206, "fade_in": 500, "fade_out": 100})
+    assert out[0, 0] == 0.0 and out[-1, 0] == 0.0
+    assert out[RATE // 2, 0] == pytest.approx(0.25, abs=1e-3)
+    assert out[RATE // 4, 0] == pytest.approx(0.125, abs=1e-3)
@@ -0,0 +1,75 @@
+import batch_progress
+
+TTL = 60
+
+
+def test_terminal_states_are_counted_once():
+    batch_progress.init("b", 3, TTL)
+    batch_progress.update("b", 0, "QUEUED", TTL)
+    batch_progress.update("b", 0, "SUCCESS", TTL, result="a.mp3")
+    batch_progress.update("b", 0, "SUCCESS", TTL, result="a.mp3")
+    batch_progress.update("b", 1, "FAILURE", TTL, error="boom")
+    counts = batch_progress.counts("b")
+    assert (counts["total"], counts["completed"], counts["failed"], counts["pending"]) == (3, 1, 1, 1)
+    assert counts["seq"] == 4
+
+
+def test_updates_merge_into_the_item():
+    batch_progress.init("b", 1, TTL)
+    batch_progress.update("b", 0, "QUEUED", TTL, text="hello " * 100, task_id="t0")
+    item = batch_progress.update("b", 0, "SUCCESS", TTL, result="a.mp3")
+    assert item["text"] == ("hello " * 100)[:batch_progress.TEXT_PREVIEW_CHARS]
+    assert (item["task_id"], item["status"], item["result"]) == ("t0", "SUCCESS", "a.mp3")
+
+
+def test_changes_page_through_everything_after_the_cursor():
+    batch_progress.init("b", 5, TTL)
+    for index in range(5):
+        batch_progress.update("b", index, "QUEUED", TTL)
+    items, cursor, has_more = batch_progress.changes("b", 0, limit=2)
+    assert [i["index"] for i in items] == [0, 1] and has_more
+    items, cursor, has_more = batch_progress.changes("b", cursor, limit=2)
+    assert [i["index"] for i in items] == [2, 3] and has_more
+    items, cursor, has_more = batch_progress.changes("b", cursor, limit=2)
+    assert [i["index"] for i in items] == [4] and not has_more
+    assert batch_progress.changes("b", cursor) == ([], cursor, False)
+
+
+def test_an_item_changed_again_is_sent_once_with_its_latest_state():
+    batch_progress.init("b", 2, TTL)
+    batch_progress.update("b", 0, "QUEUED", TTL)
+    batch_progress.update("b", 1, "QUEUED", TTL)
+    _, cursor, _ = batch_progress.changes("b", 0)
+    batch_progress.update("b", 0, "SUCCESS", TTL, result="a.mp3")
+    items, _, _ = batch_progress.changes("b", cursor)
+    assert [(i["index"], i["status"]) for i in items] == [(0, "SUCCESS")]
+
+
+def test_unknown_batch_has_no_counts():
+    assert batch_progress.counts("missing") is None
+
+
+def test_page_size_is_clamped(monkeypatch):
+    monkeypatch.setattr(batch_progress, "PAGE_SIZE", 3)
+    batch_progress.init("b", 5, TTL)
+    for index in range(5):
+        batch_progress.update("b", index, "QUEUED", TTL)
+    items, _, has_more = batch_progress.changes("b", 0, limit=1000)
+    assert len(items) == 3 and has_more
+    items, _, _ = batch_progress.changes("b", 0, limit=0)
+    assert len(items) == 1
+
+
+def test_an_item_is_counted_by_its_first_terminal_state_only():
+    batch_progress.init("b", 1, TTL)
+    batch_progress.update("b", 0, "FAILURE", TTL, error="boom")
+    batch_progress.update("b", 0, "SUCCESS", TTL, result="a.mp3")
+    counts = batch_progress.counts("b")
+    assert (counts["completed"], counts["failed"], counts["pending"]) == (0, 1, 0)
+
+
+def test_state_expires_with_the_batch():
+    batch_progress.init("b", 1, TTL)
+    batch_progress.update("b", 0, "QUEUED", TTL)
+    ttls = [batch_progress.redis_client.ttl(key) for key in batch_progress._keys("b")]
+    assert all(0 < ttl <= TTL for ttl in ttls)
@@ -0,0 +1,52 @@
+import os, time
+import derivatives
+import storage
+
+OLD = time.time() - 3600
+
+
+def make_file(path, size=1000, accessed=OLD):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    os.utime(path, (accessed, OLD))
+    return path
+
+
+def make_derivative(source_name, effects, accessed=OLD):
+    source = storage.audio_path(source_name)
+    if not os.path.exists(source):
+        make_file(source)
+    path = derivatives.derivative_path(source, derivatives.derivative_key(source, effects))
+    return make_file(path, accessed=accessed)
+
+
+def test_neutral_effects_do_not_change_the_key(workdir):
+    source = make_file(storage.audio_path("a.mp3"))
+    assert (derivatives.derivative_key(source, {"volume": 3.0, "speed": 1.0, "fade_in": 0})
+            == derivatives.derivative_key(source, {"volume": 3.00001}))
+    assert (derivatives.derivative_key(source, {"volume": 3.0})
+            != derivatives.derivative_key(source, {"volume": 4.0}))
+
+
+def test_orphans_go_first_then_least_recently_used(workdir):
+    orphan = make_derivative("gone.mp3", {"volume": 1.0})
+    os.remove(storage.audio_path("gone.mp3"))
+    kept = [make_derivative("a.mp3", {"volume": float(i)}, accessed=OLD + i) for i in range(3)]
+    assert derivatives.evict(max_bytes=2000, min_free_bytes=0) == 2
+    assert [os.path.exists(p) for p in [orphan] + kept] == [False, False, True, True]
+
+
+def test_files_removed_by_a_concurrent_evict_are_skipped(workdir, monkeypatch):
+    paths = [make_derivative("a.mp3", {"volume": float(i)}, accessed=OLD + i) for i in range(3)]
+    real_remove = os.remove
+
+    def raced_remove(path):
+        # Another worker deleted the oldest file between our scan and removal
+        if os.path.exists(paths[0]):
+            real_remove(paths[0])
+        real_remove(path)
+
+    monkeypatch.setattr(derivatives.os, "remove", raced_remove)
+    assert derivatives.evict(max_bytes=1000, min_free_bytes=0) == 1
+    assert [os.path.exists(p) for p in paths] == [False, False, True]
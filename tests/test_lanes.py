@@ -0,0 +1,88 @@
+import time
+import pytest
+import lanes
+
+
+@pytest.fixture(autouse=True)
+def small_lane(monkeypatch):
+    monkeypatch.setattr(lanes, "BATCH_LANE_CAPACITY", 4)
+    monkeypatch.setattr(lanes, "BATCH_CONCURRENCY", 2)
+
+
+def test_items_are_released_round_robin_across_users():
+    lanes.enqueue_batch("alice", "big", 10)
+    lanes.enqueue_batch("bob", "small", 2)
+    claimed = list(lanes.next_items())
+    assert sorted(claimed) == [("alice", "big", 0), ("alice", "big", 1),
+                               ("bob", "small", 0), ("bob", "small", 1)]
+
+
+def test_per_user_cap_holds_back_a_single_large_batch():
+    lanes.enqueue_batch("alice", "big", 10)
+    assert list(lanes.next_items()) == [("alice", "big", 0), ("alice", "big", 1)]
+    assert lanes.stats()["batch"]["held"] == 8
+
+
+def test_finished_item_frees_its_slot():
+    lanes.enqueue_batch("alice", "big", 10)
+    first, _ = list(lanes.next_items())
+    assert list(lanes.next_items()) == []
+    lanes.item_finished(*first)
+    assert list(lanes.next_items()) == [("alice", "big", 2)]
+
+
+def test_lost_item_gives_its_slot_back_when_the_lease_expires(monkeypatch):
+    monkeypatch.setattr(lanes, "BATCH_ITEM_LEASE_SECONDS", 1)
+    lanes.enqueue_batch("alice", "big", 10)
+    lanes.enqueue_batch("bob", "other", 10)
+    assert len(list(lanes.next_items())) == 4
+    assert lanes.stats()["batch"]["in_flight"] == 4
+    # Nobody calls item_finished: the tasks were lost
+    time.sleep(1.1)
+    assert lanes.stats()["batch"]["in_flight"] == 0
+    assert len(list(lanes.next_items())) == 4
+
+
+def test_renewed_lease_outlives_the_original(monkeypatch):
+    monkeypatch.setattr(lanes, "BATCH_ITEM_LEASE_SECONDS", 1)
+    lanes.enqueue_batch("alice", "big", 10)
+    first, second = list(lanes.next_items())
+    time.sleep(0.6)
+    assert lanes.renew(*first)
+    time.sleep(0.6)
+    # second expired, first was renewed: one slot free for alice
+    assert list(lanes.next_items()) == [("alice", "big", 2)]
+
+
+def test_renewing_a_finished_item_does_not_resurrect_it():
+    lanes.enqueue_batch("alice", "big", 3)
+    first, _ = list(lanes.next_items())
+    lanes.item_finished(*first)
+    assert not lanes.renew(*first)
+    assert lanes.stats()["batch"]["in_flight"] == 1
+
+
+def test_lane_capacity_is_shared_by_all_users():
+    for user in ("alice", "bob", "carol"):
+        lanes.enqueue_batch(user, f"{user}-batch", 5)
+    claimed = list(lanes.next_items())
+    assert len(claimed) == lanes.BATCH_LANE_CAPACITY
+    assert {user for user, _, _ in claimed} == {"alice", "bob", "carol"}
+    assert lanes.stats()["batch"]["held"] == 15 - lanes.BATCH_LANE_CAPACITY
+
+
+def test_a_users_batches_run_in_submission_order():
+    lanes.enqueue_batch("alice", "first", 1)
+    lanes.enqueue_batch("alice", "second", 2)
+    claimed = list(lanes.next_items())
+    assert claimed == [("alice", "first", 0), ("alice", "second", 0)]
+
+
+def test_drained_user_leaves_the_rotation_and_can_rejoin():
+    lanes.enqueue_batch("alice", "one", 1)
+    first = list(lanes.next_items())
+    lanes.item_finished(*first[0])
+    assert list(lanes.next_items()) == []
+    assert lanes.stats()["batch"]["users_waiting"] == 0
+    lanes.enqueue_batch("alice", "two", 1)
+    assert list(lanes.next_items()) == [("alice", "two", 0)]
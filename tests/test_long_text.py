@@ -0,0 +1,30 @@
+import long_text
+
+
+def test_sentences_are_packed_up_to_the_limit():
+    text = "One two three. Four five six. Seven eight nine. Ten."
+    assert long_text.split_text(text, 30) == ["One two three. Four five six.",
+                                               "Seven eight nine. Ten."]
+
+
+def test_closing_quotes_and_brackets_stay_with_their_sentence():
+    text = 'He said "Stop." Then he left. (Quietly.) Why?" Fine!'
+    chunks = long_text.split_text(text, 20)
+    assert chunks == ['He said "Stop."', "Then he left.", '(Quietly.) Why?"', "Fine!"]
+    assert " ".join(chunks) == text
+
+
+def test_paragraphs_are_never_merged():
+    assert long_text.split_text("First.\n\n  Second.", 100) == ["First.", "Second."]
+
+
+def test_oversized_sentences_split_on_words_then_hard_cut():
+    assert long_text.split_text("aaaa bbbb cccc", 9) == ["aaaa bbbb", "cccc"]
+    assert long_text.split_text("abcdefghij", 4) == ["abcd", "efgh", "ij"]
+
+
+def test_no_text_is_lost_or_reordered():
+    text = "Alpha beta. Gamma delta epsilon! Zeta? " * 40
+    chunks = long_text.split_text(text, 100)
+    assert all(len(c) <= 100 for c in chunks)
+    assert " ".join(chunks) == " ".join(text.split())
@@ -0,0 +1,26 @@
+import pytest
+import renditions
+
+
+def test_parse_reads_format_bitrate_and_rate():
+    assert renditions.parse(" OGG:96k@24000 ") == {"format": "ogg", "bitrate": "96k",
+                                                 "sample_rate": 24000}
+    assert renditions.parse("wav") == {"format": "wav", "bitrate": None, "sample_rate": None}
+    assert renditions.canonical(renditions.parse("mp3@22050")) == "mp3@22050"
+
+
+@pytest.mark.parametrize("spec", ["", None, "aiff", "mp3:64", "mp3:64k@4000", "ogg@200000"])
+def test_parse_rejects_unsupported_specs(spec):
+    with pytest.raises(ValueError):
+        renditions.parse(spec)
+
+
+def test_failed_encode_is_reported_until_it_expires(workdir):
+    assert renditions.failure("out/a.mp3", "wav") is None
+    assert renditions.claim_job("out/a.mp3", "wav")
+    renditions.mark_failed("out/a.mp3", "wav", "Transcoding failed")
+    renditions.release_job("out/a.mp3", "wav")
+    assert renditions.failure("out/a.mp3", "wav") == "Transcoding failed"
+    assert renditions.failure("out/a.mp3", "ogg") is None
+    ttl = renditions.redis_client.ttl(renditions._failed_key("out/a.mp3", "wav"))
+    assert 0 < ttl <= renditions.FAILED_TTL_SECONDS
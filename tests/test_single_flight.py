@@ -0,0 +1,79 @@
+import threading, time
+import pytest
+import single_flight
+
+
+def test_leader_produces_and_later_caller_reuses_published_result():
+    calls = []
+    assert single_flight.run("k", "t1", lambda: calls.append(1) or "out1") == ("out1", "t1")
+    # A caller that missed the cache just before the leader finished
+    assert single_flight.run("k", "t2", lambda: calls.append(1) or "out2") == ("out1", "t1")
+    assert len(calls) == 1
+    assert not single_flight.redis_client.exists(single_flight._lease_key("k"))
+
+
+def test_concurrent_callers_share_one_produce():
+    calls, results = [], []
+
+    def produce():
+        calls.append(1)
+        time.sleep(0.3)
+        return "shared"
+
+    def caller(owner):
+        results.append(single_flight.run("k", owner, produce))
+
+    threads = [threading.Thread(target=caller, args=(f"t{i}",)) for i in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert {result for result, _ in results} == {"shared"}
+    assert len({leader for _, leader in results}) == 1
+
+
+def test_follower_takes_over_when_leader_fails():
+    def failing():
+        time.sleep(0.2)
+        raise RuntimeError("provider down")
+
+    errors = []
+
+    def leader():
+        try:
+            single_flight.run("k", "leader", failing)
+        except RuntimeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    time.sleep(0.05)
+    assert single_flight.run("k", "follower", lambda: "retried") == ("retried", "follower")
+    thread.join()
+    assert len(errors) == 1
+
+
+def test_dead_leaders_lease_expires_and_is_taken_over():
+    single_flight.redis_client.set(single_flight._lease_key("k"), "dead", ex=1)
+    waited = []
+    result = single_flight.run("k", "t1", lambda: "fresh", on_wait=waited.append)
+    assert result == ("fresh", "t1")
+    assert waited == ["dead"]
+
+
+def test_follower_gives_up_after_max_wait(monkeypatch):
+    monkeypatch.setattr(single_flight, "FOLLOWER_MAX_WAIT", 0.2)
+    single_flight.redis_client.set(single_flight._lease_key("k"), "slow", ex=30)
+    with pytest.raises(single_flight.FollowerTimeout):
+        single_flight.run("k", "t1", lambda: "never")
+
+
+def test_only_the_owner_renews_or_releases():
+    key = single_flight._lease_key("k")
+    single_flight.redis_client.set(key, "owner", ex=30)
+    assert single_flight._RENEW(keys=[key], args=["other", 30]) == 0
+    assert single_flight._RELEASE(keys=[key], args=["other"]) == 0
+    assert single_flight.redis_client.exists(key)
+    assert single_flight._RELEASE(keys=[key], args=["owner"]) == 1
+    assert not single_flight.redis_client.exists(key)
@@ -0,0 +1,77 @@
+import os, time
+import storage
+import task_index
+
+OLD = time.time() - 2 * storage.MIN_AGE_SECONDS
+
+
+def make_audio(name, size=1000, accessed=OLD):
+    path = storage.audio_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    os.utime(path, (accessed, OLD))
+    return path
+
+
+def test_evicts_least_recently_used_until_under_quota(workdir):
+    paths = [make_audio(f"a{i}.mp3", accessed=OLD + i) for i in range(4)]
+    assert storage.evict(max_bytes=2000, min_free_bytes=0) == (2, 2000)
+    assert [os.path.exists(p) for p in paths] == [False, False, True, True]
+
+
+def test_outputs_also_linked_into_the_cache_are_evicted_only_as_needed(workdir):
+    paths = [make_audio(f"a{i}.mp3", accessed=OLD + i) for i in range(4)]
+    os.makedirs("cache", exist_ok=True)
+    os.link(paths[0], os.path.join("cache", "a0.mp3"))
+    os.link(paths[1], os.path.join("cache", "a1.mp3"))
+    assert storage.evict(max_bytes=3000, min_free_bytes=0) == (1, 3000)
+    assert [os.path.exists(p) for p in paths] == [False, True, True, True]
+
+
+def test_bytes_shared_by_two_outputs_count_until_both_are_gone(workdir):
+    first = make_audio("a.mp3", accessed=OLD)
+    second = storage.audio_path("b.mp3")
+    os.makedirs(os.path.dirname(second), exist_ok=True)
+    os.link(first, second)
+    os.utime(second, (OLD + 1, OLD))
+    make_audio("c.mp3", accessed=OLD + 2)
+    assert storage.evict(max_bytes=1000, min_free_bytes=0) == (2, 1000)
+    assert not os.path.exists(first) and not os.path.exists(second)
+
+
+def test_young_files_are_never_evicted(workdir):
+    young = make_audio("young.mp3", accessed=OLD)
+    os.utime(young, (OLD, time.time()))
+    assert storage.evict(max_bytes=0, min_free_bytes=0) == (0, 1000)
+    assert os.path.exists(young)
+
+
+def test_evicted_tasks_metadata_says_so(workdir):
+    path = make_audio("a.mp3")
+    metadata = {"task_id": "t1", "output_file": path, "timestamp": "2026-01-01T00:00:00Z"}
+    storage.write_metadata("t1", metadata)
+    task_index.index_task(metadata)
+    storage.evict(max_bytes=0, min_free_bytes=0)
+    assert storage.read_metadata("t1")["evicted"] is True
+    assert task_index.get_task("t1")["evicted"] is True
+
+
+def test_gc_keeps_fresh_empty_shards_and_removes_old_ones(workdir):
+    fresh = os.path.dirname(storage.new_audio_path())
+    old = os.path.dirname(storage.new_audio_path())
+    os.utime(old, (OLD, OLD))
+    storage.gc()
+    assert os.path.isdir(fresh) and not os.path.isdir(old)
+
+
+def test_flat_files_are_found_and_migrated_into_shards(workdir):
+    with open(os.path.join(storage.OUTPUT_DIR, "flat.mp3"), "wb") as f:
+        f.write(b"x")
+    flat_path = os.path.join(storage.OUTPUT_DIR, "flat.mp3")
+    with open(os.path.join(storage.METADATA_DIR, "t1.json"), "w") as f:
+        f.write('{"task_id": "t1", "output_file": "%s"}' % flat_path)
+    assert storage.locate_audio("flat.mp3") == flat_path
+    assert storage.migrate() == (1, 1)
+    assert storage.locate_audio("flat.mp3") == storage.audio_path("flat.mp3")
+    assert storage.read_metadata("t1")["output_file"] == storage.audio_path("flat.mp3")
@@ -0,0 +1,69 @@
+import os, time
+import synthesis_cache
+
+
+def write_source(name, size=100):
+    with open(name, "wb") as f:
+        f.write(b"\0" * size)
+    return name
+
+
+def test_only_counted_lookups_feed_the_hit_ratio(workdir):
+    assert synthesis_cache.lookup("k", "mp3") is None
+    # The in-lease re-check and the master probe of the same request
+    assert synthesis_cache.lookup("k", "mp3", count=False) is None
+    assert synthesis_cache.lookup("k", "wav", count=False) is None
+    synthesis_cache.store("k", "mp3", write_source("out.mp3"))
+    assert synthesis_cache.lookup("k", "mp3") is not None
+    stats = synthesis_cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_ratio"]) == (1, 1, 0.5)
+
+
+def test_expired_entry_is_a_miss_and_is_removed(workdir, monkeypatch):
+    path = synthesis_cache.store("k", "mp3", write_source("out.mp3"))
+    old = time.time() - 10
+    os.utime(path, (old, old))
+    monkeypatch.setattr(synthesis_cache, "CACHE_TTL_SECONDS", 5)
+    assert synthesis_cache.lookup("k", "mp3") is None
+    assert not os.path.exists(path)
+    assert synthesis_cache.stats()["misses"] == 1
+
+
+def cache_entry(key, size=1000, accessed=None, modified=None):
+    path = synthesis_cache.store_bytes(key, "mp3", b"\0" * size)
+    now = time.time()
+    os.utime(path, (accessed or now, modified or now))
+    return path
+
+
+def test_key_ignores_float_noise_and_format_case():
+    assert (synthesis_cache.cache_key("hi", "v", "neutral", 0.75, 0.75, 1.0, 1.0, "MP3")
+            == synthesis_cache.cache_key("hi", "v", "neutral", 0.750001, "0.75", 1, 1.0, "mp3"))
+    assert (synthesis_cache.cache_key("hi", "v", "neutral", 0.75, 0.75, 1.0, 1.0, "mp3")
+            != synthesis_cache.cache_key("hi!", "v", "neutral", 0.75, 0.75, 1.0, 1.0, "mp3"))
+
+
+def test_evicts_expired_entries_then_least_recently_used(workdir):
+    now = time.time()
+    expired = cache_entry("old", modified=now - 100)
+    lru = [cache_entry(f"k{i}", accessed=now - 50 + i) for i in range(3)]
+    assert synthesis_cache.evict(max_bytes=2000, ttl_seconds=60) == 2
+    assert [os.path.exists(p) for p in [expired] + lru] == [False, False, True, True]
+    assert synthesis_cache.stats()["evictions"] == 2
+
+
+def test_a_lookup_keeps_an_entry_from_being_evicted_next(workdir):
+    now = time.time()
+    paths = [cache_entry(f"k{i}", accessed=now - 50 + i) for i in range(3)]
+    synthesis_cache.lookup("k0", "mp3")
+    assert synthesis_cache.evict(max_bytes=2000, ttl_seconds=0) == 1
+    assert [os.path.exists(p) for p in paths] == [True, False, True]
+
+
+def test_writes_in_progress_are_left_alone(workdir):
+    tmp = os.path.join(synthesis_cache.CACHE_DIR, "k.mp3.123.tmp")
+    with open(tmp, "wb") as f:
+        f.write(b"\0" * 5000)
+    assert synthesis_cache.evict(max_bytes=0, ttl_seconds=0) == 0
+    assert os.path.exists(tmp)
+    assert synthesis_cache.stats()["entries"] == 0
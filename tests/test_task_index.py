@@ -0,0 +1,63 @@
+import base64, json
+import pytest
+import task_index
+
+
+def add_tasks(count, **fields):
+    for i in range(count):
+        task_index.index_task(dict({"task_id": f"t{i:02d}", "timestamp": f"2024-01-01T00:00:{i:02d}",
+                                    "voice_id": "v1", "format": "mp3",
+                                    "duration_seconds": i % 3}, **fields))
+
+
+def test_cursor_pages_cover_every_task_once(workdir):
+    add_tasks(7)
+    seen, cursor = [], None
+    while True:
+        tasks, cursor = task_index.query_tasks(sort="duration_seconds", cursor=cursor, limit=3)
+        seen += [t["task_id"] for t in tasks]
+        if cursor is None:
+            break
+    assert sorted(seen) == [f"t{i:02d}" for i in range(7)]
+    assert len(seen) == 7
+
+
+def test_filters_and_ascending_order(workdir):
+    add_tasks(3)
+    task_index.index_task({"task_id": "w", "timestamp": "2024-01-02T00:00:00",
+                           "voice_id": "v2", "format": "wav"})
+    tasks, _ = task_index.query_tasks(audio_format="mp3", descending=False)
+    assert [t["task_id"] for t in tasks] == ["t00", "t01", "t02"]
+    tasks, _ = task_index.query_tasks(date_from="2024-01-02", date_to="2024-01-02")
+    assert [t["task_id"] for t in tasks] == ["w"]
+
+
+@pytest.mark.parametrize("cursor", [
+    "MQ",  # the well-formed JSON 1
+    base64.urlsafe_b64encode(json.dumps(["x"]).encode()).decode(),
+    base64.urlsafe_b64encode(json.dumps({"a": 1}).encode()).decode(),
+    base64.urlsafe_b64encode(json.dumps(["x", 5]).encode()).decode(),
+    "not base64!",
+])
+def test_malformed_cursors_are_value_errors(workdir, cursor):
+    with pytest.raises(ValueError):
+        task_index.query_tasks(cursor=cursor)
+
+
+def test_filter_values_are_kept_without_scanning_tasks(workdir):
+    add_tasks(2)
+    task_index.index_task({"task_id": "w", "timestamp": "2024-01-02", "voice_id": "v2",
+                           "format": "wav"})
+    assert task_index.distinct_values("voice_id") == ["v1", "v2"]
+    assert task_index.distinct_values("format") == ["mp3", "wav"]
+    with pytest.raises(ValueError):
+        task_index.distinct_values("text")
+
+
+def test_filter_values_of_an_older_index_are_backfilled(workdir, monkeypatch):
+    add_tasks(1)
+    conn = task_index.connect()
+    with conn:
+        conn.execute("DELETE FROM task_filter_values")
+    monkeypatch.setattr(task_index, "_local", type(task_index._local)())
+    assert task_index.distinct_values("voice_id") == ["v1"]
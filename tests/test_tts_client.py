@@ -0,0 +1,141 @@
+import email.utils, io, time
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+import tts_client
+
+BASE_URL = "http://provider.test"
+
+
+class ScriptedAdapter(BaseAdapter):
+    """Answers each request with the next (status, headers) in the script."""
+
+    def __init__(self, script):
+        super().__init__()
+        self.script = list(script)
+        self.sent = 0
+
+    def send(self, request, **kwargs):
+        status, headers = self.script.pop(0) if self.script else (200, {})
+        self.sent += 1
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(headers)
+        response.raw = io.BytesIO(b"audio")
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def make_client(script, monkeypatch, concurrency=0):
+    monkeypatch.setattr(tts_client, "TTS_MAX_CONCURRENCY", concurrency)
+    client = tts_client.TTSClient("test-key", BASE_URL)
+    adapter = ScriptedAdapter(script)
+    client.session.mount("http://", adapter)
+    return client, adapter
+
+
+def test_streaming_error_releases_its_slot(monkeypatch):
+    client, _ = make_client([(500, {})] * 3, monkeypatch, concurrency=3)
+    for _ in range(3):
+        with pytest.raises(requests.HTTPError):
+            client.open_stream("hi", "voice", {})
+    assert client.status()["in_flight"] == 0
+    client.open_stream("hi", "voice", {}).close()
+
+
+def test_stream_holds_its_slot_until_closed(monkeypatch):
+    monkeypatch.setattr(tts_client, "TTS_MAX_WAIT_SECONDS", 0.2)
+    client, _ = make_client([], monkeypatch, concurrency=1)
+    stream = client.open_stream("hi", "voice", {})
+    assert client.status()["in_flight"] == 1
+    with pytest.raises(tts_client.RateLimitedError):
+        client.synthesize("hi", "voice", {})
+    stream.close()
+    assert client.status()["in_flight"] == 0
+    assert client.synthesize("hi", "voice", {}) == b"audio"
+
+
+def test_429_pauses_and_retries_after_retry_after(monkeypatch):
+    client, adapter = make_client([(429, {"Retry-After": "0.2"})], monkeypatch)
+    started = time.monotonic()
+    assert client.synthesize("hi", "voice", {}) == b"audio"
+    assert time.monotonic() - started >= 0.2
+    assert adapter.sent == 2
+
+
+def test_429_beyond_max_wait_raises_with_retry_after(monkeypatch):
+    monkeypatch.setattr(tts_client, "TTS_MAX_WAIT_SECONDS", 1)
+    client, _ = make_client([(429, {"Retry-After": "120"})], monkeypatch)
+    with pytest.raises(tts_client.RateLimitedError) as raised:
+        client.synthesize("hi", "voice", {})
+    assert raised.value.retry_after == 120
+    # Every worker on the key is held back, not just this one
+    assert client.status()["paused_ms"] > 100_000
+
+
+def test_request_budget_is_shared_and_enforced(monkeypatch):
+    monkeypatch.setattr(tts_client, "TTS_REQUESTS_PER_SECOND", 1)
+    monkeypatch.setattr(tts_client, "TTS_REQUEST_BURST", 2)
+    monkeypatch.setattr(tts_client, "TTS_MAX_WAIT_SECONDS", 0.2)
+    client, _ = make_client([], monkeypatch)
+    other, _ = make_client([], monkeypatch)
+    client.synthesize("hi", "voice", {})
+    other.synthesize("hi", "voice", {})
+    with pytest.raises(tts_client.RateLimitedError):
+        client.synthesize("hi", "voice", {})
+
+
+def _response_with_retry_after(value):
+    response = requests.Response()
+    if value is not None:
+        response.headers["Retry-After"] = value
+    return response
+
+
+def test_retry_after_accepts_seconds_and_http_dates():
+    assert tts_client._retry_after(_response_with_retry_after("7")) == 7
+    in_30s = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 28 <= tts_client._retry_after(_response_with_retry_after(in_30s)) <= 30
+    past = email.utils.formatdate(time.time() - 30, usegmt=True)
+    assert tts_client._retry_after(_response_with_retry_after(past)) == 0
+    assert tts_client._retry_after(_response_with_retry_after("soon")) == 1.0
+    assert tts_client._retry_after(_response_with_retry_after(None)) == 1.0
+
+
+def test_character_budget_counts_text_length(monkeypatch):
+    monkeypatch.setattr(tts_client, "TTS_CHARS_PER_SECOND", 10)
+    monkeypatch.setattr(tts_client, "TTS_CHAR_BURST", 100)
+    monkeypatch.setattr(tts_client, "TTS_MAX_WAIT_SECONDS", 0.2)
+    client, _ = make_client([], monkeypatch)
+    client.synthesize("x" * 90, "voice", {})
+    client.synthesize("x" * 10, "voice", {})
+    with pytest.raises(tts_client.RateLimitedError) as raised:
+        client.synthesize("x" * 50, "voice", {})
+    assert raised.value.retry_after == pytest.approx(5, abs=0.5)
+
+
+def test_limits_are_kept_per_api_key(monkeypatch):
+    monkeypatch.setattr(tts_client, "TTS_REQUESTS_PER_SECOND", 1)
+    monkeypatch.setattr(tts_client, "TTS_REQUEST_BURST", 1)
+    monkeypatch.setattr(tts_client, "TTS_MAX_WAIT_SECONDS", 0.2)
+    monkeypatch.setattr(tts_client, "TTS_MAX_CONCURRENCY_BY_KEY",
+                        f"{tts_client.fingerprint('other-key')}=2")
+    client, _ = make_client([], monkeypatch, concurrency=5)
+    other = tts_client.TTSClient("other-key", BASE_URL)
+    other.session.mount("http://", ScriptedAdapter([]))
+    assert (client.max_concurrency, other.max_concurrency) == (5, 2)
+    client.synthesize("hi", "voice", {})
+    other.synthesize("hi", "voice", {})
+
+
+def test_slot_of_a_crashed_holder_expires(monkeypatch):
+    monkeypatch.setattr(tts_client, "SLOT_LEASE_SECONDS", 0.1)
+    client, _ = make_client([], monkeypatch, concurrency=1)
+    client.open_stream("hi", "voice", {})  # never closed
+    time.sleep(0.15)
+    assert client.status()["in_flight"] == 0
+    assert client.synthesize("hi", "voice", {}) == b"audio"
@@ -0,0 +1,133 @@
+import logging, os, subprocess
+from pydub import AudioSegment
+from pydub.utils import mediainfo_json
+
+# Format the provider returns; anything else is converted by ffmpeg
+SOURCE_FORMAT = "mp3"
+# Bytes handed to ffmpeg's stdin per write when feeding a chunk iterator
+PIPE_CHUNK_BYTES = 64 * 1024
+
+
+class TranscodeError(RuntimeError):
+    """Raised when ffmpeg exits with an error while converting audio."""
+
+
+def _ffmpeg_command(dest, audio_format, source_format, input_args=(), output_args=()):
+    converter = AudioSegment.converter or "ffmpeg"
+    return [converter, "-hide_banner", "-loglevel", "error", "-y",
+            "-f", source_format, *input_args, "-i", "pipe:0",
+            *output_args, "-f", audio_format, dest]
+
+
+def _atomic_path(dest):
+    # The destination's storage shard may have been garbage-collected since
+    # the path was chosen
+    os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+    return f"{dest}.{os.getpid()}.part"
+
+
+def write_direct(chunks, dest):
+    """Write provider bytes to dest unchanged; no decode, no re-encode."""
+    tmp = _atomic_path(dest)
+    with open(tmp, "wb") as out:
+        for chunk in chunks:
+            out.write(chunk)
+    os.replace(tmp, dest)
+    return dest
+
+
+def pipe_through_ffmpeg(chunks, dest, audio_format, source_format=SOURCE_FORMAT,
+                        input_args=(), output_args=()):
+    """Stream encoded chunks through ffmpeg into dest; PCM never enters Python."""
+    tmp = _atomic_path(dest)
+    cmd = _ffmpeg_command(tmp, audio_format, source_format, input_args, output_args)
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE)
+    try:
+        for chunk in chunks:
+            proc.stdin.write(chunk)
+        proc.stdin.close()
+    except BrokenPipeError:
+        # ffmpeg died early; its stderr below says why
+        pass
+    stderr = proc.stderr.read()
+    returncode = proc.wait()
+    if returncode != 0:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise TranscodeError(f"ffmpeg exited with {returncode}: {stderr.decode(errors='replace').strip()}")
+    os.replace(tmp, dest)
+    return dest
+
+
+def _iter_bytes(data):
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        view = memoryview(data)
+        for offset in range(0, len(view), PIPE_CHUNK_BYTES):
+            yield view[offset:offset + PIPE_CHUNK_BYTES]
+    else:
+        yield from data
+
+
+def save_audio(data, dest, audio_format, source_format=SOURCE_FORMAT):
+    """
+    Persist encoded audio (bytes or an iterator of byte chunks) as audio_format.
+    Returns "direct" when the bytes were written as-is, "ffmpeg" when converted.
+    """
+    audio_format = (audio_format or source_format).lower()
+    if audio_format == source_format:
+        write_direct(_iter_bytes(data), dest)
+        return "direct"
+    logging.info("Transcoding %s -> %s via ffmpeg pipe: %s", source_format, audio_format, dest)
+    pipe_through_ffmpeg(_iter_bytes(data), dest, audio_format, source_format)
+    return "ffmpeg"
+
+
+def encode_pcm(pcm, dest, audio_format, sample_rate, channels, output_args=()):
+    """
+    Encode interleaved signed 16-bit PCM bytes to dest in a single ffmpeg pass;
+    output_args (e.g. "-b:a", "64k") apply to the encoder.
+    """
+    input_args = ("-ar", str(sample_rate), "-ac", str(channels))
+    pipe_through_ffmpeg(_iter_bytes(pcm), dest, audio_format, "s16le", input_args, output_args)
+    return dest
+
+
+def probe(path):
+    """(sample_rate, channels, duration in seconds or None) of the first audio stream."""
+    info = mediainfo_json(path)
+    stream = next((s for s in info.get("streams", []) if s.get("codec_type") == "audio"), None)
+    if stream is None:
+        raise TranscodeError(f"No audio stream in {path}")
+    duration = stream.get("duration") or info.get("format", {}).get("duration")
+    return int(stream["sample_rate"]), int(stream["channels"]), \
+        float(duration) if duration else None
+
+
+def iter_pcm(path, channels, block_frames):
+    """
+    Decode path with ffmpeg and yield interleaved signed 16-bit PCM, at most
+    block_frames frames at a time; only one block is in Python at once.
+    """
+    converter = AudioSegment.converter or "ffmpeg"
+    cmd = [converter, "-hide_banner", "-loglevel", "error", "-i", path,
+           "-f", "s16le", "-acodec", "pcm_s16le", "pipe:1"]
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    block_bytes = block_frames * channels * 2
+    try:
+        while True:
+            block = proc.stdout.read(block_bytes)
+            if not block:
+                break
+            yield block
+        stderr = proc.stderr.read()
+        returncode = proc.wait()
+        if returncode != 0:
+            raise TranscodeError(f"ffmpeg exited with {returncode}: {stderr.decode(errors='replace').strip()}")
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
@@ -0,0 +1,285 @@
+"""
+Shared ElevenLabs client. Each process keeps one keep-alive connection pool,
+and every worker draws from the same Redis-held request and character budgets
+and per-key concurrency slots, so the fleet runs close to quota without being
+throttled. A 429 pauses all workers on that key for its Retry-After.
+"""
+import email.utils, hashlib, logging, os, random, threading, time, uuid
+import redis, requests
+import metrics
+
+# Point at a local stand-in (benchmarks/mock_elevenlabs.py) for offline runs
+ELEVENLABS_API_URL = os.getenv("ELEVENLABS_API_URL", "https://api.elevenlabs.io").rstrip("/")
+ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
+
+# Account quota shared by every worker; 0 disables a limit
+TTS_REQUESTS_PER_SECOND = float(os.getenv("TTS_REQUESTS_PER_SECOND", 0))
+TTS_REQUEST_BURST = float(os.getenv("TTS_REQUEST_BURST", 5))
+TTS_CHARS_PER_SECOND = float(os.getenv("TTS_CHARS_PER_SECOND", 0))
+TTS_CHAR_BURST = float(os.getenv("TTS_CHAR_BURST", 5000))
+# Concurrent requests per API key: a default, plus "fingerprint=N,..." overrides
+# (fingerprints are printed by `python tts_client.py status`)
+TTS_MAX_CONCURRENCY = int(os.getenv("TTS_MAX_CONCURRENCY", 0))
+TTS_MAX_CONCURRENCY_BY_KEY = os.getenv("TTS_MAX_CONCURRENCY_BY_KEY", "")
+# Keep-alive connections per process, and how long a call may wait for
+# permits or Retry-After before the task gives up and reschedules itself
+TTS_POOL_SIZE = int(os.getenv("TTS_POOL_SIZE", 20))
+TTS_MAX_WAIT_SECONDS = float(os.getenv("TTS_MAX_WAIT_SECONDS", 30))
+TTS_CONNECT_TIMEOUT = 5
+TTS_READ_TIMEOUT = 30
+# A slot held by a worker that died is reclaimed after this long
+SLOT_LEASE_SECONDS = TTS_CONNECT_TIMEOUT + TTS_READ_TIMEOUT + 30
+
+redis_client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+
+# Admits a request only if every bucket has enough tokens and the key is not
+# paused; otherwise returns the milliseconds to wait, taking nothing.
+# KEYS: pause key, bucket keys...  ARGV: (rate, burst, cost) per bucket
+_TAKE_TOKENS = redis_client.register_script("""
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local wait = redis.call('PTTL', KEYS[1])
+if wait > 0 then return wait end
+wait = 0
+local state = {}
+for i = 2, #KEYS do
+  local rate = tonumber(ARGV[(i - 2) * 3 + 1]) / 1000
+  local burst = tonumber(ARGV[(i - 2) * 3 + 2])
+  local cost = math.min(tonumber(ARGV[(i - 2) * 3 + 3]), burst)
+  local b = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+  local tokens = tonumber(b[1]) or burst
+  local ts = tonumber(b[2]) or now
+  tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+  if tokens < cost then
+    wait = math.max(wait, math.ceil((cost - tokens) / rate))
+  end
+  state[i] = {tokens - cost, math.ceil(burst / rate) + 1000}
+end
+if wait > 0 then return wait end
+for i = 2, #KEYS do
+  redis.call('HSET', KEYS[i], 'tokens', state[i][1], 'ts', now)
+  redis.call('PEXPIRE', KEYS[i], state[i][2])
+end
+return 0
+""")
+
+# Counting semaphore whose holders expire, so crashed workers cannot leak slots.
+# KEYS: slot set  ARGV: token, limit, lease ms
+_ACQUIRE_SLOT = redis_client.register_script("""
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+  redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), ARGV[1])
+  redis.call('PEXPIRE', KEYS[1], tonumber(ARGV[3]))
+  return 1
+end
+return 0
+""")
+
+
+class RateLimitedError(Exception):
+    """No permit within TTS_MAX_WAIT_SECONDS; retry the task after retry_after."""
+
+    def __init__(self, retry_after, message="ElevenLabs rate limit"):
+        super().__init__(f"{message}, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+def fingerprint(api_key):
+    """Stable, non-secret id for an API key, used in Redis keys and config."""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:12]
+
+
+def _concurrency_limits():
+    limits = {}
+    for part in TTS_MAX_CONCURRENCY_BY_KEY.split(","):
+        name, _, value = part.strip().partition("=")
+        if name and value:
+            limits[name] = int(value)
+    return limits
+
+
+def _retry_after(response):
+    """Retry-After in seconds, given as delta-seconds or an HTTP-date."""
+    value = response.headers.get("Retry-After")
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return 1.0
+    if retry_at is None:
+        return 1.0
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class TTSClient:
+    """One API key's view of the provider: pooled session plus shared limits."""
+
+    def __init__(self, api_key=None, base_url=None):
+        self.api_key = api_key or ELEVENLABS_API_KEY
+        self.base_url = (base_url or ELEVENLABS_API_URL).rstrip("/")
+        self.key_id = fingerprint(self.api_key)
+        self.max_concurrency = _concurrency_limits().get(self.key_id, TTS_MAX_CONCURRENCY)
+        self.session = self._make_session()
+
+    def _make_session(self):
+        session = requests.Session()
+        adapter = metrics.TimedHTTPAdapter(pool_connections=4, pool_maxsize=TTS_POOL_SIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update({"xi-api-key": self.api_key or ""})
+        return session
+
+    def _key(self, name):
+        return f"tts_client:{self.key_id}:{name}"
+
+    def _wait_for_tokens(self, chars, deadline):
+        buckets, args = [], []
+        if TTS_REQUESTS_PER_SECOND > 0:
+            buckets.append(self._key("requests"))
+            args += [TTS_REQUESTS_PER_SECOND, TTS_REQUEST_BURST, 1]
+        if TTS_CHARS_PER_SECOND > 0 and chars:
+            buckets.append(self._key("chars"))
+            args += [TTS_CHARS_PER_SECOND, TTS_CHAR_BURST, chars]
+        while True:
+            wait = _TAKE_TOKENS(keys=[self._key("pause")] + buckets, args=args) / 1000.0
+            if wait <= 0:
+                return
+            if time.monotonic() + wait > deadline:
+                raise RateLimitedError(wait)
+            self._sleep("rate_limit_wait", wait)
+
+    def _acquire_slot(self, deadline):
+        if self.max_concurrency <= 0:
+            return None
+        token = uuid.uuid4().hex
+        delay = 0.05
+        while not _ACQUIRE_SLOT(keys=[self._key("slots")],
+                                args=[token, self.max_concurrency, SLOT_LEASE_SECONDS * 1000]):
+            if time.monotonic() + delay > deadline:
+                raise RateLimitedError(1.0, "ElevenLabs concurrency cap")
+            self._sleep("concurrency_wait", delay)
+            delay = min(1.0, delay * 2)
+        return token
+
+    def _release_slot(self, token):
+        if token is None:
+            return
+        try:
+            redis_client.zrem(self._key("slots"), token)
+        except Exception:
+            logging.exception("Failed to release TTS concurrency slot")
+
+    def _sleep(self, stage, seconds):
+        # A little jitter keeps waiting workers from retrying in lockstep
+        seconds *= 1 + random.random() * 0.1
+        timer = metrics.current_timer()
+        if timer is not None:
+            timer.add(stage, seconds)
+        time.sleep(seconds)
+
+    def _pause(self, seconds):
+        """Hold back every worker on this key until Retry-After has passed."""
+        redis_client.set(self._key("pause"), 1, px=max(1, int(seconds * 1000)))
+
+    def request(self, method, path, chars=0, stream=False, **kwargs):
+        """
+        Send a request once tokens and a slot are available, sleeping through
+        429 Retry-After within TTS_MAX_WAIT_SECONDS. Non-streaming responses
+        come back fully read; streaming ones hold their slot until closed.
+        """
+        url = f"{self.base_url}{path}"
+        kwargs.setdefault("timeout", (TTS_CONNECT_TIMEOUT, TTS_READ_TIMEOUT))
+        deadline = time.monotonic() + TTS_MAX_WAIT_SECONDS
+        while True:
+            self._wait_for_tokens(chars, deadline)
+            token = self._acquire_slot(deadline)
+            try:
+                if stream:
+                    response = self.session.request(method, url, stream=True, **kwargs)
+                else:
+                    response = metrics.timed_request(self.session, method, url, **kwargs)
+            except Exception:
+                self._release_slot(token)
+                raise
+            if response.status_code != 429:
+                if not response.ok:
+                    # Nobody will close an error response the caller never gets
+                    response.close()
+                    self._release_slot(token)
+                    response.raise_for_status()
+                if stream:
+                    close = response.close
+
+                    def close_and_release():
+                        try:
+                            close()
+                        finally:
+                            self._release_slot(token)
+                    response.close = close_and_release
+                else:
+                    self._release_slot(token)
+                return response
+
+            response.close()
+            self._release_slot(token)
+            retry_after = _retry_after(response)
+            self._pause(retry_after)
+            metrics.inc("tts_provider_throttled_total", {"key": self.key_id})
+            logging.warning("ElevenLabs throttled key %s, retry after %.1fs", self.key_id, retry_after)
+            if time.monotonic() + retry_after > deadline:
+                raise RateLimitedError(retry_after)
+            self._sleep("rate_limit_wait", retry_after)
+
+    def synthesize(self, text, voice_id, voice_settings):
+        """Text-to-speech in one request; returns the mp3 bytes."""
+        response = self.request("POST", f"/v1/text-to-speech/{voice_id}", chars=len(text),
+                                json={"text": text, "voice_settings": voice_settings})
+        return response.content
+
+    def open_stream(self, text, voice_id, voice_settings, params=None):
+        """Streaming text-to-speech; close the response (or use it as a context manager)."""
+        return self.request("POST", f"/v1/text-to-speech/{voice_id}/stream", chars=len(text),
+                            stream=True, params=params or {},
+                            json={"text": text, "voice_settings": voice_settings})
+
+    def voices(self):
+        return self.request("GET", "/v1/voices").json().get("voices", [])
+
+    def status(self):
+        slots = self._key("slots")
+        redis_client.zremrangebyscore(slots, "-inf", time.time() * 1000)
+        return {
+            "key": self.key_id,
+            "in_flight": redis_client.zcard(slots),
+            "max_concurrency": self.max_concurrency or None,
+            "paused_ms": max(0, redis_client.pttl(self._key("pause"))),
+            "requests_per_second": TTS_REQUESTS_PER_SECOND or None,
+            "chars_per_second": TTS_CHARS_PER_SECOND or None,
+        }
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(api_key=None):
+    """The process-wide client for api_key; rebuilt after fork so pools aren't shared."""
+    key = (os.getpid(), api_key or ELEVENLABS_API_KEY)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = TTSClient(api_key)
+        return client
+
+
+if __name__ == "__main__":
+    import json, sys
+    if sys.argv[1:] == ["status"]:
+        print(json.dumps(get_client().status(), indent=2))
+    else:
+        print("usage: python tts_client.py status")
@@ -0,0 +1,76 @@
+"""
+Voices catalog served stale-while-revalidate, so page renders never wait on
+the provider. Each process keeps an L1 copy and re-reads the shared Redis copy
+(L2) every L1_SECONDS. Once the catalog is older than REFRESH_AFTER_SECONDS,
+a background thread fetches a new one. A Redis lock makes sure only one
+process at a time does the fetch. A failed fetch keeps the old catalog.
+"""
+import json, logging, os, threading, time
+import redis
+import tts_client
+
+REFRESH_AFTER_SECONDS = int(os.getenv("VOICES_REFRESH_AFTER", 300))
+L1_SECONDS = int(os.getenv("VOICES_L1_SECONDS", 30))
+# Also the back-off after a failed refresh, since the lock is left to expire
+REFRESH_LOCK_SECONDS = 60
+CATALOG_KEY = "voices_catalog"
+LOCK_KEY = "voices_catalog:refresh"
+
+redis_client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+
+_lock = threading.Lock()
+_l1 = {"entry": None, "loaded_at": 0.0}
+_refreshing = False
+
+
+def _read_l2():
+    raw = redis_client.get(CATALOG_KEY)
+    return json.loads(raw) if raw is not None else None
+
+
+def _refresh():
+    global _refreshing
+    try:
+        # One refresher across every process
+        if not redis_client.set(LOCK_KEY, os.getpid(), nx=True, ex=REFRESH_LOCK_SECONDS):
+            return
+        voices = tts_client.get_client().voices()
+        entry = {"voices": voices, "fetched_at": time.time()}
+        # No expiry: a stale catalog beats an empty one when the provider is down
+        redis_client.set(CATALOG_KEY, json.dumps(entry))
+        redis_client.delete(LOCK_KEY)
+        with _lock:
+            _l1["entry"], _l1["loaded_at"] = entry, time.time()
+        logging.info("Refreshed voices catalog: %d voices", len(voices))
+    except Exception:
+        logging.exception("Failed to refresh voices catalog; serving the previous one")
+    finally:
+        with _lock:
+            _refreshing = False
+
+
+def _trigger_refresh():
+    global _refreshing
+    with _lock:
+        if _refreshing:
+            return
+        _refreshing = True
+    threading.Thread(target=_refresh, name="voices-refresh", daemon=True).start()
+
+
+def get_voices():
+    """The current catalog, possibly stale; empty only until the first fetch lands."""
+    now = time.time()
+    with _lock:
+        entry, loaded_at = _l1["entry"], _l1["loaded_at"]
+    if entry is None or now - loaded_at > L1_SECONDS:
+        try:
+            entry = _read_l2() or entry
+        except redis.RedisError:
+            logging.warning("Voices catalog unavailable in Redis; using the local copy")
+        with _lock:
+            _l1["entry"], _l1["loaded_at"] = entry, now
+    if entry is None or now - entry["fetched_at"] > REFRESH_AFTER_SECONDS:
+        _trigger_refresh()
+    return entry["voices"] if entry else []
+
@@ -0,0 +1,115 @@
+"""
+I/O-multiplexed worker mode. Synthesis spends almost all of its time waiting
+on the TTS API, so a worker can run on Celery's thread pool and keep many
+calls in flight per process, while the CPU-bound decode/encode steps go to a
+small, bounded process pool:
+
+    WORKER_MODE=threads TTS_POOL_SIZE=200 \\
+        celery -A app.celery_app worker --pool threads --concurrency 200
+
+In the default prefork mode every task already has a process of its own, so
+CPU work runs inline. Each worker process publishes its in-flight task count
+and CPU pool occupancy to /metrics every few seconds.
+"""
+import logging, multiprocessing, os, socket, threading, time
+from concurrent.futures import ProcessPoolExecutor
+from celery.signals import task_postrun, task_prerun
+import metrics
+
+WORKER_MODE = os.getenv("WORKER_MODE", "prefork")
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", os.cpu_count() or 2))
+# Jobs allowed to wait for a CPU worker; past this, submitting threads block
+CPU_QUEUE_LIMIT = int(os.getenv("CPU_QUEUE_LIMIT", CPU_WORKERS * 4))
+STATS_INTERVAL = 5
+
+_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+_slots = threading.BoundedSemaphore(CPU_WORKERS + CPU_QUEUE_LIMIT)
+_counts = {"tasks_in_flight": 0, "cpu_jobs": 0}
+_reporter_pid = None
+
+
+def _call_with_start(fn, args, kwargs):
+    # Runs in the pool process; the start time lets the caller split queue
+    # wait from run time
+    return time.time(), fn(*args, **kwargs)
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():
+            # spawn, not fork: the parent is full of threads holding locks
+            _executor = ProcessPoolExecutor(max_workers=CPU_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def run_cpu(fn, *args, **kwargs):
+    """
+    Run a CPU-bound, picklable fn. In threads mode it goes to the process
+    pool and the caller's StageTimer gets cpu_queue_wait; otherwise inline.
+    """
+    if WORKER_MODE != "threads":
+        return fn(*args, **kwargs)
+    timer = metrics.current_timer()
+    submitted = time.time()
+    with _slots:
+        with _lock:
+            _counts["cpu_jobs"] += 1
+        try:
+            started, result = _get_executor().submit(_call_with_start, fn, args, kwargs).result()
+        finally:
+            with _lock:
+                _counts["cpu_jobs"] -= 1
+    if timer is not None:
+        timer.add("cpu_queue_wait", started - submitted)
+    return result
+
+
+def stats():
+    with _lock:
+        cpu_jobs = _counts["cpu_jobs"]
+        tasks = _counts["tasks_in_flight"]
+    running = min(cpu_jobs, CPU_WORKERS) if WORKER_MODE == "threads" else 0
+    return {
+        "tasks_in_flight": tasks,
+        "cpu_jobs_running": running,
+        "cpu_jobs_queued": cpu_jobs - running,
+    }
+
+
+def _report_forever():
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    while True:
+        try:
+            labels = {"worker": worker, "mode": WORKER_MODE}
+            for name, value in stats().items():
+                metrics.set_gauge(f"tts_worker_{name}", value, labels)
+        except Exception:
+            logging.exception("Failed to publish worker pool stats")
+        time.sleep(STATS_INTERVAL)
+
+
+def _ensure_reporter():
+    global _reporter_pid
+    with _lock:
+        if _reporter_pid == os.getpid():
+            return
+        _reporter_pid = os.getpid()
+    threading.Thread(target=_report_forever, name="worker-pool-stats", daemon=True).start()
+
+
+@task_prerun.connect
+def _task_started(**kwargs):
+    _ensure_reporter()
+    with _lock:
+        _counts["tasks_in_flight"] += 1
+
+
+@task_postrun.connect
+def _task_finished(**kwargs):
+    with _lock:
+        _counts["tasks_in_flight"] -= 1